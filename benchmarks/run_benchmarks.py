@@ -0,0 +1,313 @@
+"""
+Benchmarks of the PDF and image tools of this repository.
+
+Every tool is run on synthetic inputs (see synthetic_data.py) and for each run the
+wall time, throughput (pages or images per second), peak memory (RSS) and size of
+the generated output are written in a JSON file, so successive runs can be compared.
+
+Usage:
+    cd automated-Life
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --tools compressPDF,turnPdfBW --pages 5,50
+    python benchmarks/run_benchmarks.py --baseline benchmarks/results/benchmark-20250101-120000.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import fitz  # PyMuPDF
+
+from benchmarks import synthetic_data
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Each tool is run through its class, the same way its run.py does it.
+# :param input_path: PDF, directory of PDFs or directory of images (see TOOLS)
+# :param output_dir: empty directory where the tool must store what it generates
+
+def _run_compress_pdf(input_path: str, output_dir: str):
+    from compressPDF.app.pdf_compressor import PDFCompressor
+    target_pdf_size = max(os.path.getsize(input_path) / (1024 * 1024) / 2, 0.05)  # half of the PDF
+    PDFCompressor(user_input=[input_path], user_dest_dir=output_dir, target_pdf_size=target_pdf_size,
+                  use_result_cache=False).process_user_request()
+
+
+def _run_pdf_snapshot(input_path: str, output_dir: str):
+    from pdfSnapShot.app.pdf_snapshot import PDFSnapshotGenerator
+    PDFSnapshotGenerator(user_input=[input_path], user_dest_path=output_dir, quality=20).generate_pdf_snapshots()
+
+
+def _run_turn_pdf_bw(input_path: str, output_dir: str):
+    from turnPdfBW.app.convert_pdf_blackwhite import PDFBlackWhiteConverter
+    PDFBlackWhiteConverter(user_input=[input_path], pdf_quality=30, user_dest_path=output_dir).convert_all_pdfs_to_BW()
+
+
+def _run_sort_merge_pdf(input_path: str, output_dir: str):
+    from sort_merge_PDF.app.pdf_sorter_merger import PDFSorterMerger
+    PDFSorterMerger(user_input=[input_path], user_dest_path=output_dir, target_pdf_size=0).process_user_request()
+
+
+def _run_image_size_reducer(input_path: str, output_dir: str):
+    from imageSizeReducer.app.reduce_image_size import ImageSizeReducer
+    ImageSizeReducer(user_input=[input_path], user_dest_path=output_dir,
+                     reduction_quality_percentage=50).process_user_request()
+
+
+def _run_image_2_pdf(input_path: str, output_dir: str):
+    from image2Pdf.app.merge_images_in_pdf import Image2PDF
+    Image2PDF(user_input_dir=input_path, user_dest_dir=output_dir).process_user_request()
+
+
+def _run_rasterizer(rasterizer_name: str, input_path: str, output_dir: str):
+    """Render every page (4 pages per call, at the resolution of compressPDF) and drop the images"""
+    from utility.rasterizer import get_rasterizer
+    rasterizer = get_rasterizer(rasterizer_name)
+    page_count = rasterizer.get_pdf_info(input_path).page_count
+    for first_page in range(1, page_count + 1, 4):
+        rasterizer.convert(input_path, dpi=150, first_page=first_page, last_page=min(first_page + 3, page_count))
+
+
+def _run_pdf_snapshot_fitz(input_path: str, output_dir: str):
+    from pdfSnapShot.app.pdf_snapshot import PDFSnapshotGenerator
+    PDFSnapshotGenerator(user_input=[input_path], user_dest_path=output_dir, quality=20,
+                         rasterizer='fitz').generate_pdf_snapshots()
+
+
+# tool name -> (function running it, kinds of dataset it takes)
+TOOLS = {
+    'compressPDF': (_run_compress_pdf, ['pdf']),
+    'pdfSnapShot': (_run_pdf_snapshot, ['pdf']),
+    'turnPdfBW': (_run_turn_pdf_bw, ['pdf']),
+    'sort_merge_PDF': (_run_sort_merge_pdf, ['pdf-dir']),
+    'imageSizeReducer': (_run_image_size_reducer, ['jpeg-dir', 'png-dir']),
+    'image2Pdf': (_run_image_2_pdf, ['jpeg-dir']),
+    'pdfSnapShot-fitz': (_run_pdf_snapshot_fitz, ['pdf']),
+    # page rendering alone, the difference of 'ms_per_unit' is the per-page latency saved by each backend
+    'rasterize-poppler': (partial(_run_rasterizer, 'poppler'), ['pdf']),
+    'rasterize-fitz': (partial(_run_rasterizer, 'fitz'), ['pdf']),
+}
+
+
+def prepare_datasets(data_dir: str, page_counts: list) -> list:
+    """
+    Generate the synthetic inputs (only the ones missing in 'data_dir', they are
+    re-used by the next runs).
+
+    :param data_dir: directory to store the inputs
+    :param page_counts: number of pages (or images) of each input
+    :return: list of dict(name, kind, path, units)
+    """
+    datasets = []
+    for page_count in page_counts:
+        for pdf_kind in synthetic_data.PDF_KINDS:
+            name = f'{pdf_kind}-{page_count}p'
+            pdf_path = os.path.join(data_dir, f'{name}.pdf')
+            if not os.path.exists(pdf_path):
+                print(f'Generating {pdf_path}')
+                synthetic_data.make_pdf(pdf_path, pdf_kind, page_count)
+            datasets.append({'name': name, 'kind': 'pdf', 'path': pdf_path, 'units': page_count})
+
+            # the same pages, one PDF per page (input of the merger)
+            pdf_dir = os.path.join(data_dir, f'{name}-split')
+            if not os.path.exists(pdf_dir):
+                _split_pdf(pdf_path, pdf_dir)
+            datasets.append({'name': f'{name}-split', 'kind': 'pdf-dir', 'path': pdf_dir, 'units': page_count})
+
+        # phone-camera like JPEGs, smaller screenshots-like PNGs
+        for extension, kind, width, height in (('.jpg', 'jpeg-dir', 3000, 2000), ('.png', 'png-dir', 1200, 800)):
+            name = f'{kind[:-4]}-{page_count}'
+            image_dir = os.path.join(data_dir, name)
+            if not os.path.exists(image_dir):
+                print(f'Generating {image_dir}')
+                synthetic_data.make_images(image_dir, page_count, width=width, height=height, extension=extension)
+            datasets.append({'name': name, 'kind': kind, 'path': image_dir, 'units': page_count})
+
+    return datasets
+
+
+def _split_pdf(pdf_path: str, pdf_dir: str):
+    """Store each page of a PDF as a separate PDF in pdf_dir"""
+    os.makedirs(pdf_dir)
+    with fitz.open(pdf_path) as pdf_document:
+        for page_number in range(pdf_document.page_count):
+            page_document = fitz.open()
+            page_document.insert_pdf(pdf_document, from_page=page_number, to_page=page_number)
+            page_document.save(os.path.join(pdf_dir, f'page-{page_number + 1}.pdf'))
+            page_document.close()
+
+
+def _peak_rss_mb(who) -> float:
+    """Peak resident memory of this process (or its children) in MB, None on Windows"""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(who).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+
+
+def _run_case(tool: str, input_path: str) -> dict:
+    """
+    Run one tool on one input (inside a fresh process, so peak memory is the tool's own).
+
+    :return: dict(wall_seconds, peak_rss_mb, peak_children_rss_mb, output_bytes, error)
+    """
+    from utility.logger_util.setup_logger import logger
+    logger.setLevel(logging.WARNING)  # keep the benchmark output readable
+    run_tool, _ = TOOLS[tool]
+
+    output_dir = tempfile.mkdtemp(prefix=f'benchmark-{tool}-')
+    error = ''
+    start_time = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):  # tools print progress
+            run_tool(input_path, output_dir)
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+        traceback.print_exc()
+    wall_seconds = time.perf_counter() - start_time
+
+    output_bytes = sum(os.path.getsize(os.path.join(root, file_name))
+                       for root, _, file_names in os.walk(output_dir) for file_name in file_names)
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+    return {
+        'wall_seconds': wall_seconds,
+        'peak_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        'peak_children_rss_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+        'output_bytes': output_bytes,
+        'error': error,
+    }
+
+
+def run_benchmarks(tools: list, datasets: list, repeat: int) -> list:
+    """
+    :param tools: names of TOOLS to run
+    :param datasets: from prepare_datasets
+    :param repeat: run each case this many times and keep the fastest run
+    :return: list of result dicts
+    """
+    results = []
+    spawn_context = multiprocessing.get_context('spawn')
+
+    for tool in tools:
+        _, dataset_kinds = TOOLS[tool]
+        for dataset in [dataset for dataset in datasets if dataset['kind'] in dataset_kinds]:
+            runs = []
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=spawn_context) as executor:
+                    runs.append(executor.submit(_run_case, tool, dataset['path']).result())
+            best_run = min(runs, key=lambda run: run['wall_seconds'])
+
+            result = {
+                'tool': tool,
+                'dataset': dataset['name'],
+                'units': dataset['units'],
+                'units_per_second': dataset['units'] / best_run['wall_seconds'] if best_run['wall_seconds'] else None,
+                'ms_per_unit': 1000 * best_run['wall_seconds'] / dataset['units'],
+                'input_bytes': _path_size(dataset['path']),
+                **best_run,
+            }
+            results.append(result)
+            _print_result(result)
+
+    return results
+
+
+def _path_size(path: str) -> int:
+    """Size of a file, or of all files in a directory, in bytes"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, file_name)) for file_name in os.listdir(path))
+
+
+def _print_result(result: dict, baseline_result: dict = None):
+    line = (f"{result['tool']:<18}{result['dataset']:<20}{result['wall_seconds']:>9.2f} s"
+            f"{result['units_per_second'] or 0:>9.2f} /s{result.get('ms_per_unit', 0):>9.1f} ms/unit")
+    if result['peak_rss_mb'] is not None:
+        line += f"{result['peak_rss_mb']:>9.0f} MB"
+    line += f"{result['output_bytes'] / (1024 * 1024):>9.2f} MB out"
+    if baseline_result and not baseline_result['error'] and not result['error']:
+        line += f"   x{baseline_result['wall_seconds'] / result['wall_seconds']:.2f} speed vs baseline"
+    if result['error']:
+        line += f"   FAILED: {result['error']}"
+    print(line)
+
+
+def compare_with_baseline(results: list, baseline_path: str):
+    """Print each result next to the same tool/dataset of a previous results file"""
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+    baseline_results = {(result['tool'], result['dataset']): result for result in baseline['results']}
+
+    print(f'\nCompared with {baseline_path} ({baseline["created"]}):')
+    for result in results:
+        _print_result(result, baseline_results.get((result['tool'], result['dataset'])))
+
+
+def run_app():
+    parser = argparse.ArgumentParser(description="Benchmarks of the PDF and image tools")
+    parser.add_argument("--tools", type=str, default=','.join(TOOLS),
+                        help=f"Optional: Tools to benchmark separated by commas. Default={','.join(TOOLS)}")
+    parser.add_argument("--pages", type=str, default='5,20',
+                        help="Optional: Page (or image) counts of the synthetic inputs separated by commas. "
+                             "Default=5,20")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Optional: Run each case this many times and keep the fastest. Default=1")
+    parser.add_argument("--data-dir", type=str, default=os.path.join(BENCHMARKS_DIR, '.data'),
+                        help="Optional: Directory of the generated inputs, re-used between runs")
+    parser.add_argument("--output", type=str, default='',
+                        help="Optional: JSON file of the results. Default=benchmarks/results/benchmark-<time>.json")
+    parser.add_argument("--baseline", type=str, default='',
+                        help="Optional: JSON file of a previous run to compare with")
+    args = parser.parse_args()
+
+    tools = [tool.strip() for tool in args.tools.split(',') if tool.strip()]
+    unknown_tools = [tool for tool in tools if tool not in TOOLS]
+    if unknown_tools:
+        parser.error(f"unknown tools {unknown_tools}, choose from {list(TOOLS)}")
+    page_counts = [int(page_count) for page_count in args.pages.split(',') if page_count.strip()]
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    datasets = prepare_datasets(args.data_dir, page_counts)
+    results = run_benchmarks(tools, datasets, repeat=max(1, args.repeat))
+
+    output_path = args.output or os.path.join(
+        BENCHMARKS_DIR, 'results', f'benchmark-{datetime.now():%Y%m%d-%H%M%S}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as output_file:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'results': results,
+        }, output_file, indent=2)
+    print(f'\nResults are stored in {output_path}')
+
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+
+if __name__ == "__main__":
+    run_app()
@@ -0,0 +1,95 @@
+"""
+Generate synthetic PDFs and images for the benchmarks, so that every run uses the
+same inputs and no personal document is needed.
+
+    text   : pages of plain text (office documents)
+    photo  : one full-page photo-like image per page (scans, photo albums)
+    mixed  : alternate text pages and pages with text and a photo
+"""
+import os
+import random
+from io import BytesIO
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw, ImageFilter
+
+PDF_KINDS = ('text', 'photo', 'mixed')
+
+LOREM_IPSUM = (
+    "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud "
+    "exercitation ullamco laboris nisi ut aliquip ex ea commodo consequat. ")
+
+
+def make_photo(width: int, height: int, seed: int) -> Image.Image:
+    """Return a photo-like RGB image: smooth shapes plus sensor-like noise (hard to compress)"""
+    rnd = random.Random(seed)
+    image = Image.new('RGB', (width, height), tuple(rnd.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rnd.randrange(width), rnd.randrange(height)
+        radius = rnd.randrange(width // 20, width // 3)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius),
+                     fill=tuple(rnd.randrange(256) for _ in range(3)))
+    image = image.filter(ImageFilter.GaussianBlur(radius=width // 100))
+
+    noise = Image.effect_noise((width, height), 30).convert('RGB')
+    return Image.blend(image, noise, 0.15)
+
+
+def _jpeg_bytes(image: Image.Image, quality: int = 92) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def make_pdf(pdf_path: str, kind: str, page_count: int, seed: int = 0) -> str:
+    """
+    :param pdf_path: where to store the PDF
+    :param kind: one of PDF_KINDS
+    :param page_count: number of pages
+    :param seed: seed of the random content
+    :return: pdf_path
+    """
+    pdf_document = fitz.open()
+    for page_number in range(page_count):
+        page = pdf_document.new_page()  # A4/Letter-like default size
+        has_photo = kind == 'photo' or (kind == 'mixed' and page_number % 2 == 1)
+
+        if kind != 'photo':
+            text_rect = page.rect + (56, 56, -56, -56)
+            if has_photo:
+                text_rect.y1 = page.rect.height / 2 - 20
+            page.insert_textbox(text_rect, f"Page {page_number + 1}\n\n" + LOREM_IPSUM * 12, fontsize=10)
+
+        if has_photo:
+            photo_rect = page.rect if kind == 'photo' else \
+                fitz.Rect(56, page.rect.height / 2, page.rect.width - 56, page.rect.height - 56)
+            # ~200 DPI over the area of the photo, like a scan
+            width, height = int(photo_rect.width / 72 * 200), int(photo_rect.height / 72 * 200)
+            photo = make_photo(width, height, seed=seed * 1000 + page_number)
+            page.insert_image(photo_rect, stream=_jpeg_bytes(photo))
+
+    pdf_document.save(pdf_path, garbage=3, deflate=True)
+    pdf_document.close()
+    return pdf_path
+
+
+def make_images(directory: str, count: int, width: int = 3000, height: int = 2000,
+                extension: str = '.jpg', seed: int = 0) -> list:
+    """
+    Store 'count' photo-like images in a directory (named image-1, image-2, ...).
+
+    :return: list of image paths
+    """
+    os.makedirs(directory, exist_ok=True)
+    image_paths = []
+    for image_number in range(1, count + 1):
+        image_path = os.path.join(directory, f'image-{image_number}{extension}')
+        photo = make_photo(width, height, seed=seed * 1000 + image_number)
+        if extension.lower() in ('.jpg', '.jpeg'):
+            photo.save(image_path, 'JPEG', quality=95)
+        else:
+            photo.save(image_path)
+        image_paths.append(image_path)
+    return image_paths
@@ -0,0 +1,96 @@
+import fitz
+from io import BytesIO
+from PIL import Image, UnidentifiedImageError
+
+from utility.logger_util.setup_logger import logger
+
+# Embedded images shown at more than this resolution are downsampled ...
+IMAGE_DPI_THRESHOLD = 225
+# ... to this resolution
+IMAGE_TARGET_DPI = 150
+# JPEG quality of the downsampled embedded images
+IMAGE_JPEG_QUALITY = 85
+
+
+def reduce_pdf_losslessly(input_pdf_path: str, image_dpi_threshold: int = IMAGE_DPI_THRESHOLD,
+                          image_target_dpi: int = IMAGE_TARGET_DPI) -> bytes:
+    """
+    Rewrite a PDF with the cheap reductions PyMuPDF offers, keeping its text and
+    vector content as it is (text stays selectable):
+        - embedded images shown above 'image_dpi_threshold' are downsampled to
+          'image_target_dpi' (the only lossy step, other images are left untouched)
+        - fonts are subset to the glyphs actually used
+        - unused and duplicate objects are removed, streams are deflated
+
+    :param input_pdf_path: path of the PDF
+    :param image_dpi_threshold: embedded images above this resolution get downsampled
+    :param image_target_dpi: resolution of the downsampled images
+    :return: bytes of the rewritten PDF
+    """
+    with fitz.open(input_pdf_path) as pdf_document:
+        downsampled_images = _downsample_images(pdf_document, image_dpi_threshold, image_target_dpi)
+
+        try:
+            pdf_document.subset_fonts()
+        except Exception as e:  # needs fontTools with older PyMuPDF versions
+            logger.debug(f"reduce_pdf_losslessly: fonts not subset: {e}")
+
+        pdf_bytes = pdf_document.tobytes(garbage=4, deflate=True, deflate_images=True,
+                                         deflate_fonts=True, clean=True)
+
+    logger.debug(f"reduce_pdf_losslessly: {downsampled_images} images downsampled in {input_pdf_path}")
+    return pdf_bytes
+
+
+def _downsample_images(pdf_document, image_dpi_threshold: int, image_target_dpi: int) -> int:
+    """
+    Replace each embedded image displayed above 'image_dpi_threshold' by a JPEG of
+    'image_target_dpi'. Images with transparency (soft mask), unusual color spaces
+    or in a format Pillow can't decode (JBIG2, ...) are skipped.
+
+    :param pdf_document: opened fitz document (modified in place)
+    :return: number of replaced images
+    """
+    processed_xrefs = set()
+    replaced_images = 0
+
+    for page in pdf_document:
+        for image_info in page.get_images(full=True):
+            xref, smask = image_info[0], image_info[1]
+            if xref in processed_xrefs or smask:
+                continue
+            processed_xrefs.add(xref)
+
+            image_rects = page.get_image_rects(xref)
+            if not image_rects:
+                continue
+
+            # if an image is shown more than once, the largest one decides its resolution
+            display_width = max(rect.width for rect in image_rects) / 72  # inches
+            extracted_image = pdf_document.extract_image(xref)
+            if not extracted_image or display_width <= 0:
+                continue
+
+            image_dpi = extracted_image['width'] / display_width
+            if image_dpi <= image_dpi_threshold:
+                continue
+
+            try:
+                image = Image.open(BytesIO(extracted_image['image']))
+                if image.mode not in ('RGB', 'L'):
+                    continue
+
+                scale = image_target_dpi / image_dpi
+                image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))),
+                                     Image.LANCZOS)
+                buffer = BytesIO()
+                image.save(buffer, 'JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True)
+            except (UnidentifiedImageError, OSError) as e:  # e.g. JBIG2, JPX without openjpeg
+                logger.debug(f"reduce_pdf_losslessly: image {xref} ({extracted_image['ext']}) kept: {e}")
+                continue
+
+            if len(buffer.getvalue()) < len(extracted_image['image']):
+                page.replace_image(xref, stream=buffer.getvalue())
+                replaced_images += 1
+
+    return replaced_images
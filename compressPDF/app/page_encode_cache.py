@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from io import BytesIO
+
+
+def encode_jpeg(image, quality: int) -> bytes:
+    """Encode a PIL image as JPEG in memory and return the encoded bytes"""
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+class PageEncodeCache:
+    """
+    A bounded in-memory cache of JPEG encoded pages keyed by (page index, quality).
+
+    The quality search of PDFCompressor encodes every page once per pass and the
+    final PDF is assembled from the chosen quality again. Keeping the encoded bytes
+    avoids both re-encoding the page and writing/reading it through a temporary file.
+
+    When the total size of cached bytes exceeds 'max_cache_mb', the least recently
+    used entries are dropped (they are simply re-encoded if requested again).
+    """
+    def __init__(self, max_cache_mb: float = 256):
+        """
+        :param max_cache_mb: (float) Upper bound on the total size of cached JPEG bytes in MB.
+        """
+        self.max_cache_bytes = int(max_cache_mb * 1024 * 1024)
+        self.cache_bytes = 0
+        self._entries = OrderedDict()  # (page index, quality) -> JPEG bytes
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key) -> bool:
+        """:param key: (page index, quality)"""
+        return key in self._entries
+
+    def get(self, page_index: int, quality: int):
+        """Return the cached JPEG bytes of a page at given quality or None"""
+        key = (page_index, quality)
+        jpeg_bytes = self._entries.get(key)
+        if jpeg_bytes is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return jpeg_bytes
+
+    def put(self, page_index: int, quality: int, jpeg_bytes: bytes):
+        """Store the JPEG bytes of a page, evicting least recently used entries if needed"""
+        key = (page_index, quality)
+        if key in self._entries:
+            self.cache_bytes -= len(self._entries.pop(key))
+
+        if len(jpeg_bytes) > self.max_cache_bytes:
+            return  # would evict everything else and still not fit
+
+        self._entries[key] = jpeg_bytes
+        self.cache_bytes += len(jpeg_bytes)
+
+        while self.cache_bytes > self.max_cache_bytes:
+            _, evicted_bytes = self._entries.popitem(last=False)
+            self.cache_bytes -= len(evicted_bytes)
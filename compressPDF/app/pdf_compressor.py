@@ -1,13 +1,38 @@
 import fitz
-from pdf2image import convert_from_path
 import os
-import tempfile
+import math
 from typing import List
+import filecmp
 import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from utility.logger_util.setup_logger import logger
 from utility import file_functions
 from utility import pdf_functions
+from utility import search_functions
+from utility.batch_scheduler import BatchJob, BatchScheduler
+from utility.rasterizer import DEFAULT_RASTERIZER, get_rasterizer
+from compressPDF.app.page_encode_cache import PageEncodeCache, encode_jpeg
+from compressPDF.app import quality_allocator
+from compressPDF.app import lossless_reducer
+from compressPDF.app.result_cache import CompressionResultCache
+
+# Resolution at which PDF pages are converted to images: 96/150
+RASTER_DPI = 150
+
+# Range of JPEG quality in which the compressor looks for the best fitting quality
+MIN_JPEG_QUALITY = 2
+MAX_JPEG_QUALITY = 98
+
+# Bytes a PDF built by fitz adds on top of its JPEG page images (calibrated with
+# PyMuPDF: ~3 KB for the document itself, ~0.5 KB per page/image object).
+PDF_DOCUMENT_OVERHEAD_BYTES = 3 * 1024
+PDF_PAGE_OVERHEAD_BYTES = 512
+
+# How often the 'adaptive' strategy may re-allocate the budget (one PDF built each time)
+# to get under the target size and then within TARGET_TOLERANCE below it
+MAX_ALLOCATION_ROUNDS = 6
+TARGET_TOLERANCE = 0.03
 
 
 class PDFCompressor:
@@ -40,18 +65,54 @@ class PDFCompressor:
            of input directories as a parameter.
         2. Call the process_user_request method to complete the process.
     """
-    def __init__(self, user_input: List[str], user_dest_dir: str = '', target_pdf_size=999):
+    def __init__(self, user_input: List[str], user_dest_dir: str = '', target_pdf_size=999,
+                 quality_strategy: str = 'bisection', max_search_passes: int = 10,
+                 encode_cache_mb: float = 256, workers: int = 1, max_memory_mb: float = 0,
+                 lossless_first: bool = True, jobs: int = 1, max_inflight_pages: int = 0,
+                 use_result_cache: bool = False, result_cache_mb: float = 1024,
+                 rasterizer: str = DEFAULT_RASTERIZER):
         """
         :param user_input (list): A list of input directories/PDFs where the PDF files are located.
         :param user_dest_dir (str): User specified optional destination directory to store generated compressed PDFs.
         :param target_pdf_size: (float) Target PDF size of each PDF in MB.
+        :param quality_strategy: (str) How to choose the JPEG quality: 'bisection', 'linear'
+            (one quality for all pages) or 'adaptive' (a quality per page).
+        :param max_search_passes: (int) Upper bound on encode passes for 'bisection' strategy.
+        :param encode_cache_mb: (float) Memory in MB for keeping JPEG encoded pages between passes.
+        :param workers: (int) Number of CPU cores used to rasterize and encode the pages of a PDF.
+        :param max_memory_mb: (float) If set, pages are rendered in chunks so that roughly this
+            much memory is used for page images, whatever the number of pages (streaming mode).
+        :param lossless_first: (bool) Try to reach the target size by rewriting the PDF
+            (keeping its text) before falling back to rasterizing every page.
+        :param jobs: (int) Number of PDFs compressed at the same time (processes).
+        :param max_inflight_pages: (int) With jobs > 1, upper bound on the pages of the PDFs
+            compressed at the same time (0: no bound).
+        :param use_result_cache: (bool) Keep a copy of each compressed PDF in '.compress-cache' inside
+            the destination directory, and re-use it if the source PDF and the parameters did not change.
+        :param result_cache_mb: (float) Upper bound on the size of the result cache in MB.
+        :param rasterizer: (str) Backend rendering the pages: 'poppler' (pdf2image) or 'fitz' (PyMuPDF)
         """
         self.user_input = user_input
         self.user_dest_dir: str = user_dest_dir
         self.target_pdf_size = target_pdf_size
+        self.quality_strategy = quality_strategy
+        self.max_search_passes = max_search_passes
+        self.encode_cache_mb = encode_cache_mb
+        self.workers = max(1, workers)
+        self.max_memory_mb = max_memory_mb
+        self.lossless_first = lossless_first
+        self.jobs = max(1, jobs)
+        self.max_inflight_pages = max_inflight_pages
+        self.use_result_cache = use_result_cache
+        self.result_cache_mb = result_cache_mb
+        self.rasterizer = get_rasterizer(rasterizer)
 
     def process_user_request(self):
         """Iterate over each input directory/PDFs and generate compressed PDF files"""
+        if self.jobs > 1:
+            self._process_batch()
+            return
+
         for input_path in self.user_input:
             input_path = input_path.strip()
             if not os.path.exists(input_path):
@@ -72,17 +133,15 @@ class PDFCompressor:
         PDF file and store a copy of PDF there.
 
         :param source_pdf_path: absolute path
-        :return:
+        :return: path of the copy
         """
-        compressed_pdf_file_path, compressed_pdf_dir_path = \
-            self.get_unique_path_for_compressed_pdf(source_pdf_path)
-
-        file_functions.create_directory(compressed_pdf_dir_path)
+        compressed_pdf_file_path, compressed_pdf_dir_path = self._reserve_compressed_pdf_path(source_pdf_path)
 
         shutil.copy(source_pdf_path, compressed_pdf_file_path)
 
         print(f"Compressed file is stored in directory: {compressed_pdf_dir_path}")
         print('.' * 45)
+        return compressed_pdf_file_path
 
     def get_unique_path_for_compressed_pdf(self, file_path: str) -> (str, str):
         """
@@ -102,63 +161,614 @@ class PDFCompressor:
 
         return pdf_file_path, pdf_dest_dir
 
+    def _reserve_compressed_pdf_path(self, file_path: str) -> (str, str):
+        """
+        Like get_unique_path_for_compressed_pdf, but also create the destination
+        directory and an empty file at the returned path, so that another process
+        (--jobs) compressing a PDF of the same name can't pick the same path.
+
+        :param file_path: absolute file path
+        :return: (absolute path of the reserved file, absolute of PDF directory)
+        """
+        while True:
+            pdf_file_path, pdf_dest_dir = self.get_unique_path_for_compressed_pdf(file_path)
+            file_functions.create_directory(pdf_dest_dir)
+            try:
+                open(pdf_file_path, 'x').close()  # fails if another process created it since
+                return pdf_file_path, pdf_dest_dir
+            except FileExistsError:
+                continue
+
     def reduce_pdf_size(self, input_pdf_path: str):
-        """Generate JPEG image of each page within the PDF files
+        """Generate a compressed copy of a PDF within the target size.
+
+        If the same PDF (same content) was already compressed into the destination
+        directory with the same parameters, the previous result is re-used.
+
         :param input_pdf_path: <str> A path to a PDF file to process.
+        :return: path of the compressed PDF, None if it was not possible to create it
         """
         print(f'Processing file "{os.path.basename(input_pdf_path)}"')
 
         if not os.path.exists(input_pdf_path):
             logger.error(f"ERROR: PDF {input_pdf_path} does not exist")
-            return
+            return None
+
+        if not self.use_result_cache:
+            return self._reduce_pdf_size(input_pdf_path)
+
+        _, compressed_pdf_dir_path = self.get_unique_path_for_compressed_pdf(input_pdf_path)
+        result_cache = CompressionResultCache(compressed_pdf_dir_path, max_cache_mb=self.result_cache_mb)
+        cache_key = result_cache.make_key(input_pdf_path, self._result_cache_parameters())
+
+        cached_pdf_path = result_cache.lookup(cache_key)
+        compressed_pdf_file_path = self._copy_cached_pdf(input_pdf_path, cached_pdf_path) if cached_pdf_path else None
+        if compressed_pdf_file_path:
+            logger.info(f"{os.path.basename(input_pdf_path)}: Unchanged since last run, re-used the cached result")
+            print(f"File is stored in directory: {compressed_pdf_dir_path}")
+            print('.' * 45)
+            return compressed_pdf_file_path
+
+        compressed_pdf_file_path = self._reduce_pdf_size(input_pdf_path)
+        if compressed_pdf_file_path:
+            result_cache.store(cache_key, compressed_pdf_file_path)
+        return compressed_pdf_file_path
+
+    def _copy_cached_pdf(self, input_pdf_path: str, cached_pdf_path: str):
+        """
+        Put the cached result of a PDF in the destination directory, unless an
+        identical output of a previous run is still there.
+
+        :param input_pdf_path: path of the source PDF
+        :param cached_pdf_path: compressed PDF found in the result cache
+        :return: path of the compressed PDF, None if the cached one is gone
+        """
+        compressed_pdf_file_path = None
+        try:
+            identical_pdf_file_path = self._find_identical_output(input_pdf_path, cached_pdf_path)
+            if identical_pdf_file_path:
+                return identical_pdf_file_path
+            compressed_pdf_file_path, _ = self._reserve_compressed_pdf_path(input_pdf_path)
+            shutil.copyfile(cached_pdf_path, compressed_pdf_file_path)
+            return compressed_pdf_file_path
+        except OSError as e:  # evicted by another process (--jobs, concurrent runs) since the lookup
+            logger.debug(f"{os.path.basename(input_pdf_path)}: cached result not re-used: {e}")
+            if compressed_pdf_file_path and os.path.exists(compressed_pdf_file_path):
+                os.remove(compressed_pdf_file_path)
+            return None
+
+    def _find_identical_output(self, input_pdf_path: str, cached_pdf_path: str):
+        """
+        Look for the output of a previous run among 'compressed_<name>.pdf',
+        'compressed_<name>_dup_1.pdf', ... so a rerun doesn't add one more copy of it.
 
+        :param input_pdf_path: path of the source PDF
+        :param cached_pdf_path: compressed PDF found in the result cache
+        :return: path of a compressed PDF with the same content, None if there's none
+        """
+        pdf_dest_dir = self.user_dest_dir or os.path.join(file_functions.get_directory_name(input_pdf_path),
+                                                          'compressed-pdf')
+        pdf_file_path = os.path.join(pdf_dest_dir, f'compressed_{file_functions.get_file_name(input_pdf_path)}')
+        file_extension, base_name = file_functions.get_file_extension(pdf_file_path)
+
+        counter = 0
+        while os.path.exists(pdf_file_path):
+            if filecmp.cmp(pdf_file_path, cached_pdf_path, shallow=False):
+                return pdf_file_path
+            counter += 1
+            pdf_file_path = f"{base_name}_dup_{counter}{file_extension}"
+        return None
+
+    def _result_cache_parameters(self) -> dict:
+        """Parameters which change the compressed PDF, part of the result cache key"""
+        return {
+            'target_pdf_size': self.target_pdf_size,
+            'dpi': RASTER_DPI,
+            'quality_strategy': self.quality_strategy,
+            'max_search_passes': self.max_search_passes,
+            'streaming': bool(self.max_memory_mb),
+            'lossless_first': self.lossless_first,
+            'rasterizer': self.rasterizer.name,
+        }
+
+    def _reduce_pdf_size(self, input_pdf_path: str):
+        """Generate JPEG image of each page within the PDF files
+        :param input_pdf_path: <str> A path to a PDF file to process.
+        :return: path of the compressed PDF, None if it was not possible to create it
+        """
         pdf_file_size = file_functions.get_file_size_in_mb(input_pdf_path)
         if pdf_file_size <= self.target_pdf_size:
             logger.debug(f"user must be kidding. Just copy his PDF.")
-            self.copy_pdf_file(input_pdf_path)
-            return
+            return self.copy_pdf_file(input_pdf_path)
+
+        if self.lossless_first:
+            pdf_bytes = lossless_reducer.reduce_pdf_losslessly(input_pdf_path)
+            if len(pdf_bytes) / (1024 * 1024) < self.target_pdf_size:
+                logger.info(f"{os.path.basename(input_pdf_path)}: Reduced without rasterizing pages")
+                return self._save_compressed_pdf(input_pdf_path, pdf_bytes)
+
+        if self.max_memory_mb:
+            page_qualities, pdf_bytes, passes = self._compress_streaming(input_pdf_path)
+        else:
+            images = self._rasterize(input_pdf_path)
+
+            # JPEG bytes of each page are kept in memory, so the final save (and any
+            # repeated quality) re-uses them instead of re-encoding the page
+            encode_cache = PageEncodeCache(max_cache_mb=self.encode_cache_mb)
+
+            if self.quality_strategy == 'adaptive':
+                page_qualities, pdf_bytes, passes = self._compress_adaptive(images, encode_cache)
+            else:
+                page_qualities, pdf_bytes, passes = self._compress_uniform(images, encode_cache)
+
+        if pdf_bytes is None:
+            logger.warning(f"File {input_pdf_path}: not possible to reach target size of "
+                           f"{self.target_pdf_size} MB (tried {passes} passes)")
+            return None
+
+        quality = f"{min(page_qualities)}%" if min(page_qualities) == max(page_qualities) else \
+            f"{min(page_qualities)}-{max(page_qualities)}%"
+        logger.info(f"{os.path.basename(input_pdf_path)}: Reduced to {quality} quality in {passes} passes")
+        return self._save_compressed_pdf(input_pdf_path, pdf_bytes)
+
+    def _save_compressed_pdf(self, input_pdf_path: str, pdf_bytes: bytes) -> str:
+        """
+        Store the bytes of the compressed PDF at a unique path in the destination directory.
 
-        images = convert_from_path(input_pdf_path, dpi=150)  # Convert PDF pages to images: 96/150
+        :param input_pdf_path: path of the source PDF
+        :param pdf_bytes: bytes of the compressed PDF
+        :return: path of the compressed PDF
+        """
+        # Decide where you want to save the newly generated compressed PDF (and create its directory)
+        compressed_pdf_file_path, compressed_pdf_dir_path = self._reserve_compressed_pdf_path(input_pdf_path)
+
+        # save the already verified PDF
+        with open(compressed_pdf_file_path, 'wb') as pdf_file:
+            pdf_file.write(pdf_bytes)
+        print(f"File is stored in directory: {compressed_pdf_dir_path}")
+        print('.' * 45)
+        return compressed_pdf_file_path
 
-        quality = 100
-        while quality > 2:
-            quality -= 2
-            # print(f"Processing to maintain {quality}% quality. File: {os.path.basename(input_pdf_path)}")
+    def _compress_uniform(self, images: list, encode_cache: PageEncodeCache):
+        """
+        Search one JPEG quality for all pages so that the PDF fits the target size.
+
+        Whether a quality fits is decided on an estimate of the PDF size from the
+        encoded page sizes; the PDF is serialized only for the chosen quality. If
+        that verification shows the estimate was too optimistic, the per-page
+        overhead is re-calibrated from the real size and the search continues below
+        the rejected quality.
 
-            # Important: Create a new PDF writer for each attempt to avoid appending to
-            # an existing PDF.
+        :param images: list of PIL images, one per page
+        :param encode_cache: cache of already encoded pages
+        :return: (quality of each page, PDF bytes or None if target is not reachable, passes used)
+        """
+        page_overhead = PDF_PAGE_OVERHEAD_BYTES
+        max_quality = MAX_JPEG_QUALITY
+        total_passes = 0
+
+        while True:
+            def fits(quality: int) -> bool:
+                jpeg_pages = self._encode_pages(images, [quality] * len(images), encode_cache)
+                jpeg_sizes = [len(jpeg_bytes) for jpeg_bytes in jpeg_pages]
+                estimated_size = self._estimate_pdf_size_in_bytes(jpeg_sizes, page_overhead)
+                return estimated_size / (1024 * 1024) < self.target_pdf_size
+
+            quality, passes = self._search_quality(fits, max_quality=max_quality)
+            total_passes += passes
+
+            if quality is None:
+                return [], None, total_passes
+
+            # verification: serialize the PDF once (pages come from the encode cache)
+            page_qualities = [quality] * len(images)
+            pdf_bytes = self._build_pdf(images, page_qualities, encode_cache).tobytes()
+            if len(pdf_bytes) / (1024 * 1024) < self.target_pdf_size:
+                return page_qualities, pdf_bytes, total_passes
+
+            jpeg_pages = self._encode_pages(images, page_qualities, encode_cache)
+            jpeg_bytes_size = sum(len(jpeg_bytes) for jpeg_bytes in jpeg_pages)
+            page_overhead = (len(pdf_bytes) - PDF_DOCUMENT_OVERHEAD_BYTES - jpeg_bytes_size) / len(images)
+            max_quality = quality - 1
+
+    def _compress_adaptive(self, images: list, encode_cache: PageEncodeCache):
+        """
+        Give each page its own JPEG quality so that the PDF fits the target size.
+
+        Every page is encoded at a few sample qualities to learn how its size
+        grows with quality. The byte budget of the target size is then split
+        across the pages: pages which are small even at high quality (text on white)
+        keep it, and the heavy pages (photos, scans) share the rest of the budget
+        equally. The quality of a heavy page is interpolated from its sampled
+        sizes, and the budget refined on the real size of the PDF (see
+        _fit_allocation). If that leaves more of the target unused than one quality
+        for all pages would, the uniform result is taken.
+
+        :param images: list of PIL images, one per page
+        :param encode_cache: cache of already encoded pages
+        :return: (quality of each page, PDF bytes or None if target is not reachable, passes used)
+        """
+        target_size = self.target_pdf_size * 1024 * 1024
+        size_curves = [{} for _ in images]  # per page {quality: JPEG size}
+
+        passes = 0
+        for quality in quality_allocator.ALLOCATION_SAMPLE_QUALITIES:
+            passes += 1
+            jpeg_pages = self._encode_pages(images, [quality] * len(images), encode_cache)
+            for i, jpeg_bytes in enumerate(jpeg_pages):
+                size_curves[i][quality] = len(jpeg_bytes)
+
+        def build(page_qualities: List[int]):
+            jpeg_sizes = [len(jpeg_bytes) for jpeg_bytes in self._encode_pages(images, page_qualities, encode_cache)]
+            return self._build_pdf(images, page_qualities, encode_cache).tobytes(), jpeg_sizes
+
+        page_qualities, pdf_bytes, allocation_passes = self._fit_allocation(
+            size_curves, lambda budget: self._allocate_page_qualities(size_curves, budget), build)
+        passes += allocation_passes
+        if pdf_bytes is not None and len(pdf_bytes) >= target_size * (1 - TARGET_TOLERANCE):
+            return page_qualities, pdf_bytes, passes
+
+        uniform_qualities, uniform_pdf_bytes, uniform_passes = self._compress_uniform(images, encode_cache)
+        passes += uniform_passes
+        if uniform_pdf_bytes is not None and (pdf_bytes is None or len(uniform_pdf_bytes) > len(pdf_bytes)):
+            return uniform_qualities, uniform_pdf_bytes, passes
+        return page_qualities, pdf_bytes, passes
+
+    def _fit_allocation(self, size_curves: List[dict], allocate, build):
+        """
+        Find the page qualities of the largest PDF under the target size, for an
+        allocation of the bytes left for the page images ('budget') to the pages.
+
+        The qualities are estimated from a few sampled sizes, so the first PDF is
+        often well under the target (or over it). Each PDF built adds the real size
+        of every page at its quality to the size curves, and the budget is grown by
+        the bytes left unused (or shrunk by the overshoot), then bisected between
+        the largest budget that fitted and the smallest one that didn't, until the
+        PDF is within TARGET_TOLERANCE below the target, no quality lies between
+        these two allocations any more, or MAX_ALLOCATION_ROUNDS PDFs were built.
+
+        :param size_curves: per page {quality: JPEG size}, completed with the real sizes
+        :param allocate: callable(budget) -> quality of each page, None if nothing fits
+        :param build: callable(page qualities) -> (PDF bytes, JPEG size of each page)
+        :return: (quality of each page, PDF bytes or None if target is not reachable, passes used)
+        """
+        target_size = self.target_pdf_size * 1024 * 1024
+        budget = target_size - self._estimate_pdf_size_in_bytes([0] * len(size_curves), PDF_PAGE_OVERHEAD_BYTES)
+        fitting_budget, overshooting_budget = 0, math.inf
+
+        best_qualities, best_pdf_bytes = [], None
+        overshooting_qualities = None
+        pdf_sizes = {}  # page qualities -> size of their PDF
+        passes = 0
+
+        for _ in range(MAX_ALLOCATION_ROUNDS):
+            page_qualities = allocate(budget) if budget > 0 else None
+            if page_qualities is None:
+                break
+
+            if tuple(page_qualities) in pdf_sizes:  # the budget changed too little to change a quality
+                pdf_size = pdf_sizes[tuple(page_qualities)]
+            else:
+                passes += 1
+                pdf_bytes, jpeg_sizes = build(page_qualities)
+                pdf_size = pdf_sizes[tuple(page_qualities)] = len(pdf_bytes)
+                for size_curve, quality, jpeg_size in zip(size_curves, page_qualities, jpeg_sizes):
+                    size_curve[quality] = jpeg_size
+                if pdf_size < target_size and (best_pdf_bytes is None or pdf_size > len(best_pdf_bytes)):
+                    best_qualities, best_pdf_bytes = page_qualities, pdf_bytes
+
+            if pdf_size < target_size:
+                if pdf_size >= target_size * (1 - TARGET_TOLERANCE):
+                    break
+                fitting_budget = max(fitting_budget, budget)
+                budget = budget + (target_size - pdf_size) if math.isinf(overshooting_budget) else \
+                    (fitting_budget + overshooting_budget) / 2
+            else:
+                if budget < overshooting_budget:
+                    overshooting_budget, overshooting_qualities = budget, page_qualities
+                # shrink the budget by the overshoot (with 2% margin)
+                budget = budget * (target_size / pdf_size) * 0.98 if not fitting_budget else \
+                    (fitting_budget + overshooting_budget) / 2
+
+            if best_pdf_bytes is not None and overshooting_qualities is not None and \
+                    all(abs(fitting - overshooting) <= 1
+                        for fitting, overshooting in zip(best_qualities, overshooting_qualities)):
+                break  # one quality step from the overshoot: nothing left in between
+
+        return best_qualities, best_pdf_bytes, passes
+
+    def _compress_streaming(self, input_pdf_path: str):
+        """
+        Compress the PDF without holding all of its rendered pages in memory.
+
+        Pages are rendered in chunks sized from 'max_memory_mb'. In a first pass each
+        chunk is encoded at the sample qualities of 'quality_allocator' and only the
+        encoded sizes are remembered (the bytes go into a small encode cache), then
+        the chunk is released. The quality of every page ('bisection'/'linear': one
+        for all, 'adaptive': one per page) is chosen from these size curves without
+        encoding again. A second pass renders the chunks again (skipping chunks
+        whose pages are all in the cache), encodes them at the chosen quality and
+        appends them to the output PDF. The real page sizes of that pass refine the
+        qualities, and the second pass is repeated until the PDF is close below the
+        target (see _fit_allocation).
+
+        :param input_pdf_path: path of the PDF
+        :return: (quality of each page, PDF bytes or None if target is not reachable, passes used)
+        """
+        page_chunks = self._plan_page_chunks(input_pdf_path)
+
+        # a quarter of the memory for encoded pages, half of it for rendered pages
+        encode_cache = PageEncodeCache(max_cache_mb=min(self.encode_cache_mb, self.max_memory_mb / 4))
+
+        size_curves = []  # per page {quality: JPEG size}
+        page_dimensions = []  # per page (width, height) in pixels
+        for first_page, last_page in page_chunks:
+            images = self._rasterize(input_pdf_path, first_page=first_page, last_page=last_page)
+            chunk_size_curves = [{} for _ in images]
+            for quality in quality_allocator.ALLOCATION_SAMPLE_QUALITIES:
+                jpeg_pages = self._encode_pages(images, [quality] * len(images), encode_cache,
+                                                first_page_index=first_page - 1)
+                for size_curve, jpeg_bytes in zip(chunk_size_curves, jpeg_pages):
+                    size_curve[quality] = len(jpeg_bytes)
+
+            size_curves.extend(chunk_size_curves)
+            page_dimensions.extend((image.width, image.height) for image in images)
+            del images
+
+        def allocate(budget: float):
+            if self.quality_strategy == 'adaptive':
+                return self._allocate_page_qualities(size_curves, budget)
+
+            def fits(quality: int) -> bool:
+                estimated_size = sum(quality_allocator.interpolate_size(size_curve, quality)
+                                     for size_curve in size_curves)
+                return estimated_size < budget
+
+            quality, _ = self._search_quality(fits)
+            return None if quality is None else [quality] * len(size_curves)
+
+        def build(page_qualities: List[int]):
             writer = fitz.open()
+            jpeg_sizes = []
+            for first_page, last_page in page_chunks:
+                chunk_qualities = page_qualities[first_page - 1:last_page]
+                images = None
+                if any((first_page - 1 + i, quality) not in encode_cache
+                       for i, quality in enumerate(chunk_qualities)):
+                    images = self._rasterize(input_pdf_path, first_page=first_page, last_page=last_page)
+
+                jpeg_pages = self._encode_pages(images, chunk_qualities, encode_cache,
+                                                first_page_index=first_page - 1)
+                self._insert_pages(writer, page_dimensions[first_page - 1:last_page], jpeg_pages)
+                jpeg_sizes.extend(len(jpeg_bytes) for jpeg_bytes in jpeg_pages)
+                del images
+            return writer.tobytes(), jpeg_sizes
+
+        page_qualities, pdf_bytes, passes = self._fit_allocation(size_curves, allocate, build)
+        return page_qualities, pdf_bytes, passes + len(quality_allocator.ALLOCATION_SAMPLE_QUALITIES)
+
+    def _plan_page_chunks(self, input_pdf_path: str) -> list:
+        """
+        Split the pages of a PDF in chunks whose rendered images take at most half
+        of 'max_memory_mb' (estimated from the largest page at RASTER_DPI in RGB).
+
+        :param input_pdf_path: path of the PDF
+        :return: list of (first_page, last_page), 1-based and inclusive
+        """
+        with fitz.open(input_pdf_path) as pdf_document:
+            page_count = pdf_document.page_count
+            largest_page_area = max(page.rect.width * page.rect.height for page in pdf_document)
+
+        raw_page_bytes = largest_page_area * (RASTER_DPI / 72) ** 2 * 3
+        pages_per_chunk = max(1, int(self.max_memory_mb * 1024 * 1024 / 2 // raw_page_bytes))
+
+        return [(first_page, min(first_page + pages_per_chunk - 1, page_count))
+                for first_page in range(1, page_count + 1, pages_per_chunk)]
 
-            with tempfile.TemporaryDirectory() as temp_dir:
-                for i, image in enumerate(images):
-                    img_path = os.path.join(temp_dir, f'temp_{i}.jpg')
+    @staticmethod
+    def _allocate_page_qualities(size_curves: List[dict], budget: float) -> List[int]:
+        """
+        Split a byte budget across pages and return the JPEG quality of each page.
 
-                    image.save(img_path, 'JPEG', quality=quality)
+        :param size_curves: per page {sampled quality: JPEG size}
+        :param budget: bytes available for all page images
+        :return: JPEG quality of each page
+        """
+        page_demands = [size_curve[max(size_curve)] for size_curve in size_curves]
+        cap = quality_allocator.water_fill_page_cap(page_demands, budget)
+        return [quality_allocator.interpolate_quality(size_curve, cap, MIN_JPEG_QUALITY, MAX_JPEG_QUALITY)
+                for size_curve in size_curves]
 
-                    page = writer.new_page(width=image.width, height=image.height)
-                    page.insert_image(fitz.Rect(0, 0, image.width, image.height),
-                                      filename=img_path)
+    @staticmethod
+    def _estimate_pdf_size_in_bytes(jpeg_sizes: List[int], page_overhead: float) -> float:
+        """
+        Estimate the size of a PDF made of one JPEG image per page without assembling it.
 
-                temp_pdf_path = os.path.join(temp_dir, f'temp_{quality}.pdf')
-                writer.save(temp_pdf_path)
+        :param jpeg_sizes: size in bytes of the JPEG encoded image of each page
+        :param page_overhead: bytes added by the PDF for each page (page/image objects, xref)
+        :return: estimated PDF size in bytes
+        """
+        return PDF_DOCUMENT_OVERHEAD_BYTES + sum(jpeg_sizes) + page_overhead * len(jpeg_sizes)
 
-                temp_pdf_file_size = file_functions.get_file_size_in_mb(temp_pdf_path)
+    def _search_quality(self, fits, max_quality: int = MAX_JPEG_QUALITY) -> (int, int):
+        """
+        Find the highest JPEG quality for which 'fits' reports the assembled PDF is
+        within the target size.
 
-                if temp_pdf_file_size < self.target_pdf_size:
-                    # print(f"{os.path.basename(input_pdf_path)}: Reduced to {quality}%")
+        'bisection' halves the quality range after every pass, so it needs
+        ~log2(MAX_JPEG_QUALITY) passes. 'linear' walks the quality down in steps of 2
+        and is only kept to compare results/timings with the old behaviour.
 
-                    # Decide where you want to save the newly generated compressed PDF
-                    compressed_pdf_file_path, compressed_pdf_dir_path = \
-                        self.get_unique_path_for_compressed_pdf(input_pdf_path)
+        :param fits: callable(quality) -> bool, each call is one encode pass over all pages
+        :param max_quality: highest quality that may be chosen
+        :return: (chosen quality or None, number of passes used)
+        """
+        if self.quality_strategy == 'linear':
+            passes = 0
+            for quality in range(max_quality, MIN_JPEG_QUALITY - 1, -2):
+                passes += 1
+                if fits(quality):
+                    return quality, passes
+            return None, passes
+
+        return search_functions.bisect_highest_quality(
+            fits, min_quality=MIN_JPEG_QUALITY, max_quality=max_quality,
+            max_iterations=self.max_search_passes)
+
+    def _build_pdf(self, images: list, page_qualities: List[int], encode_cache: PageEncodeCache):
+        """
+        Encode each page image as JPEG at its quality and assemble them in a PDF.
 
-                    # create the destination directory for the compressed PDF
-                    file_functions.create_directory(compressed_pdf_dir_path)
+        :param images: list of PIL images, one per page
+        :param page_qualities: JPEG quality of each page
+        :param encode_cache: cache of already encoded pages
+        :return: fitz document (not saved yet)
+        """
+        # Important: Create a new PDF writer for each attempt to avoid appending to
+        # an existing PDF.
+        writer = fitz.open()
 
-                    # save the PDF
-                    writer.save(compressed_pdf_file_path)
-                    print(f"File is stored in directory: {compressed_pdf_dir_path}")
-                    print('.' * 45)
-                    break
+        jpeg_pages = self._encode_pages(images, page_qualities, encode_cache)
+        PDFCompressor._insert_pages(writer, [(image.width, image.height) for image in images], jpeg_pages)
+        return writer
+
+    @staticmethod
+    def _insert_pages(writer, page_dimensions: list, jpeg_pages: List[bytes]):
+        """
+        Append one page per JPEG image to a fitz document.
+
+        :param writer: fitz document
+        :param page_dimensions: (width, height) of each page image in pixels
+        :param jpeg_pages: JPEG bytes of each page
+        """
+        for (width, height), jpeg_bytes in zip(page_dimensions, jpeg_pages):
+            page = writer.new_page(width=width, height=height)
+            page.insert_image(fitz.Rect(0, 0, width, height), stream=jpeg_bytes)
+
+    def _rasterize(self, input_pdf_path: str, first_page: int = None, last_page: int = None) -> list:
+        """
+        Convert PDF pages to images. With more than one worker, the pages are
+        split in contiguous page ranges which are rasterized in parallel processes
+        (each one a separate rasterizer call with first_page/last_page).
+
+        :param input_pdf_path: path of the PDF
+        :param first_page: first page to convert (1-based), default: first page of the PDF
+        :param last_page: last page to convert (inclusive), default: last page of the PDF
+        :return: list of PIL images in page order
+        """
+        if self.workers <= 1:
+            return self.rasterizer.convert(input_pdf_path, dpi=RASTER_DPI, first_page=first_page,
+                                           last_page=last_page)
+
+        if not first_page or not last_page:
+            with fitz.open(input_pdf_path) as pdf_document:
+                page_count = pdf_document.page_count
+            first_page, last_page = first_page or 1, last_page or page_count
+
+        page_count = last_page - first_page + 1
+        if page_count < 1:  # PDF without pages
+            return []
+        pages_per_worker = math.ceil(page_count / self.workers)
+        page_ranges = [(range_first_page, min(range_first_page + pages_per_worker - 1, last_page))
+                       for range_first_page in range(first_page, last_page + 1, pages_per_worker)]
+
+        images = []
+        with ProcessPoolExecutor(max_workers=len(page_ranges)) as executor:
+            futures = [executor.submit(_rasterize_page_range, self.rasterizer.name, input_pdf_path,
+                                       range_first_page, range_last_page)
+                       for range_first_page, range_last_page in page_ranges]
+            for future in futures:  # keep page order
+                images.extend(future.result())
+        return images
+
+    def _encode_pages(self, images: list, page_qualities: List[int], encode_cache: PageEncodeCache,
+                      first_page_index: int = 0) -> List[bytes]:
+        """
+        JPEG encode each page at its quality, re-using pages already in the cache.
+
+        With more than one worker, pages missing in the cache are encoded in a thread
+        pool: Pillow releases the GIL while encoding, so threads use all cores
+        without copying the page images to other processes.
+
+        :param images: list of PIL images, one per page (may be None if all pages are cached)
+        :param page_qualities: JPEG quality of each page
+        :param encode_cache: cache of already encoded pages
+        :param first_page_index: index of the first page within the document (cache key)
+        :return: JPEG bytes of each page, in page order
+        """
+        jpeg_pages = [encode_cache.get(first_page_index + i, quality) for i, quality in enumerate(page_qualities)]
+        missing_pages = [i for i, jpeg_bytes in enumerate(jpeg_pages) if jpeg_bytes is None]
+
+        def encode(i: int) -> bytes:
+            return encode_jpeg(images[i], page_qualities[i])
+
+        if self.workers > 1 and len(missing_pages) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                encoded_pages = list(executor.map(encode, missing_pages))
+        else:
+            encoded_pages = [encode(i) for i in missing_pages]
+
+        for i, jpeg_bytes in zip(missing_pages, encoded_pages):
+            encode_cache.put(first_page_index + i, page_qualities[i], jpeg_bytes)
+            jpeg_pages[i] = jpeg_bytes
+
+        return jpeg_pages
+
+    def _process_batch(self):
+        """
+        Compress all PDFs of all input paths with a pool of 'jobs' processes.
+
+        The complete list of PDFs is built first, so the scheduler can start the
+        largest files first (a big file started last would dominate the wall time)
+        and keep the pages being processed at the same time under 'max_inflight_pages'.
+        """
+        jobs = [BatchJob(path=pdf_file_path,
+                         size_in_bytes=file_functions.get_file_size_in_bytes(pdf_file_path),
+                         cost=max(1, pdf_functions.get_page_count(pdf_file_path)))
+                for pdf_file_path in self._build_work_list()]
+        logger.info(f"Compressing {len(jobs)} PDFs with {self.jobs} processes")
+
+        scheduler = BatchScheduler(workers=self.jobs, max_inflight_cost=self.max_inflight_pages)
+        for batch_result in scheduler.run(self.reduce_pdf_size, jobs):
+            if batch_result.error:
+                continue
+            if batch_result.result is None:
+                logger.warning(f"NOT COMPRESSED: File {batch_result.job.path} processed in "
+                               f"{batch_result.elapsed_seconds:.1f} seconds, no compressed PDF written.\n")
+                continue
+            logger.info(f"SUCCESS: File {batch_result.job.path} processed in "
+                        f"{batch_result.elapsed_seconds:.1f} seconds.\n")
+
+    def _build_work_list(self) -> List[str]:
+        """
+        :return: unique paths of all PDFs given as input or found in the input
+            directories (including subdirectories)
+        """
+        pdf_file_paths = []
+        for input_path in self.user_input:
+            input_path = input_path.strip()
+            if not os.path.exists(input_path):
+                logger.error(f"ERROR: input path {input_path} does not exist.\n")
+                continue
+
+            if pdf_functions.is_pdf(file_path=input_path):
+                pdf_file_paths.append(input_path)
+            elif file_functions.is_directory(path=input_path):  # Directory
+                pdf_file_paths.extend(self._find_pdf_files(input_directory=input_path))
+
+        return list(dict.fromkeys(pdf_file_paths))  # remove duplicates, keep order
+
+    def _find_pdf_files(self, input_directory: str) -> List[str]:
+        """Notice, it's a recursive function.
+        :param input_directory (str): The path to the input directory.
+        :return: paths of the PDFs in the directory and its subdirectories
+        """
+        pdf_file_paths = file_functions.list_files(
+            directory=input_directory, file_extensions=['.pdf'])
+
+        for directory in file_functions.list_directories(input_directory):
+            pdf_file_paths.extend(self._find_pdf_files(directory))
+        return pdf_file_paths
 
     def _process_pdfs_files(self, pdf_file_paths: List[str]):
         """Process each PDF file to generate compressed PDF within specified target size in MB.
@@ -184,3 +794,9 @@ class PDFCompressor:
 
         for directory in list_dir:
             self._process_directory(directory)
+
+
+def _rasterize_page_range(rasterizer_name: str, input_pdf_path: str, first_page: int, last_page: int) -> list:
+    """Convert a range of PDF pages to images (runs in a worker process)"""
+    return get_rasterizer(rasterizer_name).convert(input_pdf_path, dpi=RASTER_DPI, first_page=first_page,
+                                                   last_page=last_page)
@@ -0,0 +1,95 @@
+import math
+from typing import Dict, List
+
+# JPEG qualities at which each page is sampled to learn its size/quality curve; the
+# lowest one is the lowest quality the compressor may choose, so small targets are
+# never rejected on the size of a higher sample
+ALLOCATION_SAMPLE_QUALITIES = (95, 70, 40, 10, 2)
+
+
+def water_fill_page_cap(page_demands: List[int], budget: float) -> float:
+    """
+    Find the largest per-page byte cap such that every page is given
+    min(its demand, cap) bytes and the total stays within the budget.
+
+    Pages which need less than the cap (mostly white text pages) keep all they ask
+    for; the bytes they don't use are shared by the heavy pages (photos, scans).
+
+    Example:
+        >>> water_fill_page_cap([10, 100, 100], budget=110)
+        50.0
+
+    :param page_demands: bytes each page would take at the highest sampled quality
+    :param budget: total bytes available for all page images
+    :return: per-page cap in bytes (infinity if every page fits at its demand)
+    """
+    if sum(page_demands) <= budget:
+        return math.inf
+
+    remaining_budget = budget
+    remaining_pages = len(page_demands)
+    for demand in sorted(page_demands):
+        fair_share = remaining_budget / remaining_pages
+        if demand > fair_share:
+            return fair_share
+        remaining_budget -= demand
+        remaining_pages -= 1
+
+    return remaining_budget
+
+
+def interpolate_quality(size_curve: Dict[int, int], cap: float, min_quality: int, max_quality: int) -> int:
+    """
+    Estimate the highest JPEG quality of a page whose encoded size stays within 'cap'.
+
+    The page's size is only known at the sampled qualities, in between the
+    quality is interpolated linearly on the logarithm of the size (JPEG size grows
+    roughly exponentially with quality).
+
+    :param size_curve: {sampled quality: encoded size in bytes} of one page
+    :param cap: bytes available for this page
+    :param min_quality: lowest quality that may be returned
+    :param max_quality: highest quality that may be returned
+    :return: JPEG quality
+    """
+    samples = sorted(size_curve.items())  # ascending quality (and size)
+
+    if cap >= samples[-1][1]:
+        return samples[-1][0]
+    if cap < samples[0][1]:
+        return min_quality
+
+    for (low_quality, low_size), (high_quality, high_size) in zip(samples, samples[1:]):
+        if low_size <= cap < high_size:
+            if high_size == low_size:
+                return low_quality
+            ratio = (math.log(cap) - math.log(low_size)) / (math.log(high_size) - math.log(low_size))
+            quality = int(low_quality + ratio * (high_quality - low_quality))
+            return max(min_quality, min(quality, max_quality))
+
+    return min_quality
+
+
+def interpolate_size(size_curve: Dict[int, int], quality: int) -> float:
+    """
+    Estimate the encoded size of a page at given JPEG quality from its sampled sizes
+    (inverse of 'interpolate_quality'). Outside the sampled range the size of the
+    nearest sample is returned, which over-estimates below the lowest sample.
+
+    :param size_curve: {sampled quality: encoded size in bytes} of one page
+    :param quality: JPEG quality
+    :return: estimated size in bytes
+    """
+    samples = sorted(size_curve.items())  # ascending quality (and size)
+
+    if quality <= samples[0][0]:
+        return samples[0][1]
+    if quality >= samples[-1][0]:
+        return samples[-1][1]
+
+    for (low_quality, low_size), (high_quality, high_size) in zip(samples, samples[1:]):
+        if low_quality <= quality <= high_quality:
+            ratio = (quality - low_quality) / (high_quality - low_quality)
+            return math.exp(math.log(low_size) + ratio * (math.log(high_size) - math.log(low_size)))
+
+    return samples[-1][1]
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from utility.logger_util.setup_logger import logger
+from utility import file_functions
+
+# Name of the cache directory created inside the destination directory
+RESULT_CACHE_DIR_NAME = '.compress-cache'
+
+
+class CompressionResultCache:
+    """
+    A persistent cache of compressed PDFs, stored in the destination directory.
+
+    Entries are keyed by the SHA-256 of the source PDF's content plus the parameters
+    that change the output (target size, DPI, quality strategy, ...), so an unchanged
+    PDF compressed again with the same parameters is not rasterized at all: its
+    previous output is copied to the new destination. The cache keeps copies of its
+    own (not hard links), so editing or deleting a compressed PDF never changes it.
+
+    Layout:
+        destination_directory
+        └── .compress-cache
+            ├── cache.sqlite    <== key -> object, size, last use
+            └── objects
+                └── <key>       <== compressed PDF (no .pdf extension on purpose, so
+                                    that tools scanning for PDFs don't pick it up)
+
+    When the objects take more than 'max_cache_mb', the least recently used ones
+    are evicted.
+    """
+    def __init__(self, dest_dir: str, max_cache_mb: float = 1024):
+        """
+        :param dest_dir: (str) Destination directory of the compressed PDFs.
+        :param max_cache_mb: (float) Upper bound on the size of all cached PDFs in MB.
+        """
+        self.cache_dir = os.path.join(dest_dir, RESULT_CACHE_DIR_NAME)
+        self.objects_dir = os.path.join(self.cache_dir, 'objects')
+        self.max_cache_bytes = int(max_cache_mb * 1024 * 1024)
+
+        file_functions.create_directory(self.objects_dir)
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS results ('
+                               'key TEXT PRIMARY KEY, size INTEGER, last_used REAL)')
+
+    @contextmanager
+    def _connect(self):
+        """Open the database for one transaction (committed on success, then closed)"""
+        # several processes may use the same cache (--jobs), wait for each other's writes
+        connection = sqlite3.connect(os.path.join(self.cache_dir, 'cache.sqlite'), timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def make_key(source_pdf_path: str, parameters: dict) -> str:
+        """
+        :param source_pdf_path: path of the PDF to compress
+        :param parameters: everything besides the content that changes the compressed PDF
+        :return: hex digest identifying the compressed PDF
+        """
+        sha256 = hashlib.sha256()
+        with open(source_pdf_path, 'rb') as pdf_file:
+            for chunk in iter(lambda: pdf_file.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        sha256.update(json.dumps(parameters, sort_keys=True).encode())
+        return sha256.hexdigest()
+
+    def lookup(self, key: str):
+        """
+        :param key: key from make_key
+        :return: path of the cached compressed PDF, None if there's none
+        """
+        object_path = os.path.join(self.objects_dir, key)
+        with self._connect() as connection:
+            row = connection.execute('SELECT key FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+
+            if not os.path.exists(object_path):  # removed by hand, forget it
+                connection.execute('DELETE FROM results WHERE key = ?', (key,))
+                return None
+
+            connection.execute('UPDATE results SET last_used = ? WHERE key = ?', (time.time(), key))
+        return object_path
+
+    def store(self, key: str, compressed_pdf_path: str):
+        """
+        Keep a compressed PDF in the cache, then evict the least recently used
+        entries while the cache is over its size.
+
+        :param key: key from make_key
+        :param compressed_pdf_path: path of the compressed PDF to keep
+        """
+        object_path = os.path.join(self.objects_dir, key)
+        temporary_path = f'{object_path}.{os.getpid()}'  # other processes only ever see a complete copy
+        try:
+            shutil.copyfile(compressed_pdf_path, temporary_path)
+            os.replace(temporary_path, object_path)
+        except OSError as e:
+            logger.error(f"CompressionResultCache: cannot store {compressed_pdf_path}: {e}")
+            return
+
+        with self._connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO results (key, size, last_used) VALUES (?, ?, ?)',
+                               (key, os.path.getsize(object_path), time.time()))
+            self._evict(connection)
+
+    def _evict(self, connection):
+        """Remove least recently used entries until the cache is within its size"""
+        total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        rows = connection.execute('SELECT key, size FROM results ORDER BY last_used').fetchall()
+
+        for key, size in rows:
+            if total_size <= self.max_cache_bytes:
+                break
+            connection.execute('DELETE FROM results WHERE key = ?', (key,))
+            object_path = os.path.join(self.objects_dir, key)
+            if os.path.exists(object_path):
+                os.remove(object_path)
+            total_size -= size
+
@@ -2,6 +2,7 @@ import argparse
 # from typing import List
 from compressPDF.app.pdf_compressor import PDFCompressor
 from utility.user_input_functions import get_clean_user_input_paths, get_clean_user_output_path
+from utility.rasterizer import DEFAULT_RASTERIZER, RASTERIZER_NAMES
 
 
 def run_app():
@@ -9,6 +10,32 @@ def run_app():
     parser.add_argument("--input-paths", type=str, help="Paths to the input PDFs or directories separated by commas", required=True)
     parser.add_argument("--dest-dir", type=str, help="Optional destination directory path to store the compressed PDF", default='')
     parser.add_argument("--target-pdf-size", type=int, help="Optional: Enter target size in MB for each compressed PDF", required=True)
+    parser.add_argument("--quality-strategy", type=str, choices=['bisection', 'linear', 'adaptive'], default='bisection',
+                        help="Optional: How to choose the JPEG quality that fits the target size. Default=bisection")
+    parser.add_argument("--max-search-passes", type=int, default=10,
+                        help="Optional: Upper bound on encode passes used by the bisection search. Default=10")
+    parser.add_argument("--encode-cache-mb", type=float, default=256,
+                        help="Optional: Memory in MB to keep JPEG encoded pages between passes. Default=256")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Optional: Number of CPU cores used to rasterize and encode the pages of a PDF. Default=1")
+    parser.add_argument("--max-memory-mb", type=float, default=0,
+                        help="Optional: Render pages in chunks to keep memory for page images around this value in MB. "
+                             "Default=0 (render the whole PDF at once)")
+    parser.add_argument("--skip-lossless-stage", action="store_true",
+                        help="Optional: Always rasterize pages, don't try to rewrite the PDF with its text first")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Optional: Number of PDFs compressed at the same time (largest first). Default=1")
+    parser.add_argument("--max-inflight-pages", type=int, default=0,
+                        help="Optional: With --jobs, upper bound on the pages of PDFs compressed at the same time. "
+                             "Default=0 (no bound)")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="Optional: Keep a copy of each compressed PDF in '.compress-cache' inside the destination "
+                             "directory, and re-use it when a PDF didn't change since the last run")
+    parser.add_argument("--result-cache-mb", type=float, default=1024,
+                        help="Optional: With --result-cache, upper bound in MB on the cached copies. Default=1024")
+    parser.add_argument("--rasterizer", type=str, choices=RASTERIZER_NAMES, default=DEFAULT_RASTERIZER,
+                        help="Optional: Backend rendering the pages, 'poppler' (pdf2image) or 'fitz' (PyMuPDF, "
+                             f"in-process). Default={DEFAULT_RASTERIZER}")
     args = parser.parse_args()
 
     # todo (02 Mar 2024): May be add an attribute 'memory_unit' and provide options
@@ -27,7 +54,18 @@ def run_app():
     # dest_dir = r'C:\Users\MANTOSH\Downloads\del'
     # target_pdf_size = 2 # in MB
 
-    pdf_compressor = PDFCompressor(user_input=input_dirs, user_dest_dir=dest_dir, target_pdf_size=target_pdf_size)
+    pdf_compressor = PDFCompressor(user_input=input_dirs, user_dest_dir=dest_dir, target_pdf_size=target_pdf_size,
+                                   quality_strategy=args.quality_strategy,
+                                   max_search_passes=args.max_search_passes,
+                                   encode_cache_mb=args.encode_cache_mb,
+                                   workers=args.workers,
+                                   max_memory_mb=args.max_memory_mb,
+                                   lossless_first=not args.skip_lossless_stage,
+                                   jobs=args.jobs,
+                                   max_inflight_pages=args.max_inflight_pages,
+                                   use_result_cache=args.result_cache,
+                                   result_cache_mb=args.result_cache_mb,
+                                   rasterizer=args.rasterizer)
     pdf_compressor.process_user_request()
 
 
@@ -0,0 +1,199 @@
+from abc import ABC, abstractmethod
+from io import BytesIO
+
+from PIL import Image
+
+# Range of the quality search of the lossy formats (the quality of Pillow's encoders)
+MIN_QUALITY = 4
+MAX_QUALITY = 98
+# When no quality fits the target size, the image is scaled down so that it fits at
+# this quality at least: below it, artefacts look worse than a smaller image
+SCALING_QUALITY = 70
+# Same for PNG and GIF, in number of colors of the palette: fewer colors band too much
+SCALING_COLORS = 64
+# WebP: effort of the encoder, 0 (fastest) to 6 (slowest, smallest files)
+WEBP_METHOD = 4
+
+# Formats the images of other formats (BMP, TIFF, ...) may be transcoded to, see get_encoder
+TRANSCODE_FORMATS = ('jpeg', 'webp')
+
+
+class ImageEncoder(ABC):
+    """
+    Encodes images of one format in memory at a 'level' (a quality, a number of
+    colors...) the file size grows with, so the level fitting a target size can be
+    found by bisection between min_level and max_level. Each format gets the search
+    that works for it, instead of passing 'quality' to encoders which ignore it.
+
+    How To Use:
+    -----------
+        encoder = get_encoder('PNG')
+        image_bytes = encoder.encode(image, level=encoder.max_level)
+    """
+    format = ''  # PIL format
+    extension = ''  # extension of the files written in this format
+    min_level = 0
+    max_level = 0
+    scaling_level = 0  # lowest level worth keeping before scaling the image down instead
+    level_name = ''  # prefix of the output file name, e.g. 'Q' for 'Q80_photo.jpg'
+
+    @abstractmethod
+    def encode(self, image: Image.Image, level: int) -> bytes:
+        """
+        :param image: PIL image of any mode, converted if the format needs it
+        :param level: between min_level and max_level
+        :return: encoded file
+        """
+        raise NotImplementedError
+
+    def finish(self, image: Image.Image, level: int, image_bytes: bytes) -> bytes:
+        """
+        Return the file written for the chosen level: by default the encoding the
+        search found, formats searching with fast settings encode it again here.
+
+        :param image: the image encoded at 'level' into image_bytes
+        :param level: chosen level
+        :param image_bytes: encoding of the search
+        :return: encoded file, never larger than image_bytes
+        """
+        return image_bytes
+
+    def get_label(self, level: int) -> str:
+        """:return: what the output file name starts with, e.g. 'Q80'"""
+        return f'{self.level_name}{level}'
+
+
+class JpegEncoder(ImageEncoder):
+    """JPEG, the level is the quality"""
+    format = 'JPEG'
+    extension = '.jpg'
+    min_level = MIN_QUALITY
+    max_level = MAX_QUALITY
+    scaling_level = SCALING_QUALITY
+    level_name = 'Q'
+
+    def encode(self, image: Image.Image, level: int) -> bytes:
+        if image.mode not in ('RGB', 'L', 'CMYK'):
+            image = _flatten(image)
+        output_buffer = BytesIO()
+        image.save(output_buffer, format=self.format, quality=level, optimize=True)
+        return output_buffer.getvalue()
+
+
+class WebpEncoder(ImageEncoder):
+    """WebP (lossy), the level is the quality"""
+    format = 'WEBP'
+    extension = '.webp'
+    min_level = MIN_QUALITY
+    max_level = MAX_QUALITY
+    scaling_level = SCALING_QUALITY
+    level_name = 'Q'
+
+    def encode(self, image: Image.Image, level: int) -> bytes:
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if _has_alpha(image) else 'RGB')
+        output_buffer = BytesIO()
+        image.save(output_buffer, format=self.format, quality=level, method=WEBP_METHOD)
+        return output_buffer.getvalue()
+
+
+class PngEncoder(ImageEncoder):
+    """
+    PNG is lossless: the only way to a smaller file is fewer colors. The level is
+    the number of colors of the palette the image is quantized to (fast octree,
+    alpha kept); max_level keeps all colors.
+
+    The search compresses at zlib's default level; the chosen level is written at
+    the highest compression, about 10% smaller but 5 to 20 times slower.
+    """
+    format = 'PNG'
+    extension = '.png'
+    min_level = 2
+    max_level = 257  # all colors
+    scaling_level = SCALING_COLORS
+    level_name = 'C'
+    search_options = {'compress_level': 6}
+    final_options = {'optimize': True}
+
+    def encode(self, image: Image.Image, level: int) -> bytes:
+        return self._save(self._quantize(image, level), self.search_options)
+
+    def finish(self, image: Image.Image, level: int, image_bytes: bytes) -> bytes:
+        if self.final_options is None:
+            return image_bytes
+        return min(self._save(self._quantize(image, level), self.final_options), image_bytes, key=len)
+
+    def _quantize(self, image: Image.Image, level: int) -> Image.Image:
+        if level >= self.max_level:
+            return image
+        return image.convert('RGBA' if _has_alpha(image) else 'RGB').quantize(colors=level, method=Image.FASTOCTREE)
+
+    def _save(self, image: Image.Image, options: dict) -> bytes:
+        output_buffer = BytesIO()
+        image.save(output_buffer, format=self.format, **options)
+        return output_buffer.getvalue()
+
+    def get_label(self, level: int) -> str:
+        return 'C' if level >= self.max_level else super().get_label(level)
+
+
+class GifEncoder(PngEncoder):
+    """GIF, a palette of at most 256 colors: the level is the number of colors, as for PNG"""
+    format = 'GIF'
+    extension = '.gif'
+    search_options = {'optimize': True}  # LZW has no compression setting: a single encoding
+    final_options = None
+
+
+class LosslessEncoder(ImageEncoder):
+    """Formats without a size setting (BMP, TIFF, ...): a single level, only scaling reduces the size"""
+    level_name = 'reduced'
+
+    def __init__(self, image_format: str):
+        self.format = image_format
+
+    def encode(self, image: Image.Image, level: int) -> bytes:
+        output_buffer = BytesIO()
+        image.save(output_buffer, format=self.format)
+        return output_buffer.getvalue()
+
+    def get_label(self, level: int) -> str:
+        return self.level_name
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    return image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """Return an RGB copy of the image, transparent pixels on white"""
+    if not _has_alpha(image):
+        return image.convert('RGB')
+    rgba_image = image.convert('RGBA')
+    flat_image = Image.new('RGB', rgba_image.size, 'white')
+    flat_image.paste(rgba_image, mask=rgba_image.getchannel('A'))
+    return flat_image
+
+
+_ENCODERS = {encoder.format: encoder for encoder in (JpegEncoder, WebpEncoder, PngEncoder, GifEncoder)}
+# Pillow opens the JPEGs of many cameras and phones (with a preview or depth image) as
+# 'MPO', a JPEG followed by more JPEGs: they're written as a plain JPEG of the first image
+_ENCODERS['MPO'] = JpegEncoder
+_TRANSCODE_ENCODERS = {'jpeg': JpegEncoder, 'webp': WebpEncoder}
+
+
+def get_encoder(image_format: str, transcode_to: str = '') -> ImageEncoder:
+    """
+    :param image_format: PIL format of the image, such as 'JPEG'
+    :param transcode_to: one of TRANSCODE_FORMATS to write the images of formats without
+        an encoder of their own in that format, empty to keep their format
+    :return: the encoder of that format
+    """
+    if transcode_to and transcode_to not in _TRANSCODE_ENCODERS:
+        raise ValueError(f"unknown transcode format '{transcode_to}', choose from {', '.join(TRANSCODE_FORMATS)}")
+
+    if image_format in _ENCODERS:
+        return _ENCODERS[image_format]()
+    if transcode_to:
+        return _TRANSCODE_ENCODERS[transcode_to]()
+    return LosslessEncoder(image_format)
@@ -0,0 +1,93 @@
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image
+
+# Images are compared on their luma channel (eyes are most sensitive to it) at full
+# resolution: any downscale averages the JPEG/WebP artifacts away (a text scan at JPEG
+# quality 4 keeps an SSIM of 0.99 at 512 pixels, 0.95 at half size, 0.82 at full size).
+# The lumas are kept as 8-bit and the metrics computed on strips of this many rows, so
+# their memory doesn't grow with the height of the image.
+METRIC_STRIP_ROWS = 256
+# SSIM: side of the square window, and the constants stabilizing the division (Wang et al.)
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+# PSNR of identical images
+MAX_PSNR = 100.0
+
+
+class ImageQuality(NamedTuple):
+    """How close an encoded image is to the original"""
+    ssim: float  # structural similarity, 1.0 for identical images
+    psnr: float  # peak signal-to-noise ratio in dB, MAX_PSNR for identical images
+
+
+def get_luma(image: Image.Image) -> np.ndarray:
+    """
+    :param image: PIL image of any mode
+    :return: 2D uint8 array of the luma (0-255) of the image
+    """
+    return np.asarray(image.convert('L'), dtype=np.uint8)
+
+
+def compare(reference_luma: np.ndarray, image: Image.Image) -> ImageQuality:
+    """
+    :param reference_luma: get_luma of the original image
+    :param image: encoded image, same size as the original
+    :return: SSIM and PSNR of the image against the original
+    """
+    luma = get_luma(image)
+    return ImageQuality(ssim=ssim(reference_luma, luma), psnr=psnr(reference_luma, luma))
+
+
+def psnr(reference: np.ndarray, image: np.ndarray) -> float:
+    """Peak signal-to-noise ratio in dB of two 2D arrays of 0-255 values"""
+    squared_error = 0.0
+    for top in range(0, reference.shape[0], METRIC_STRIP_ROWS):
+        rows = slice(top, top + METRIC_STRIP_ROWS)
+        squared_error += float(np.sum((reference[rows].astype(np.float64) - image[rows]) ** 2))
+    mse = squared_error / reference.size
+    if not mse:
+        return MAX_PSNR
+    return min(MAX_PSNR, float(10 * np.log10(255 ** 2 / mse)))
+
+
+def ssim(reference: np.ndarray, image: np.ndarray) -> float:
+    """
+    Mean structural similarity of two 2D arrays of 0-255 values, one strip of rows
+    at a time. The sums of every SSIM_WINDOW x SSIM_WINDOW window are added up
+    exactly in integers (no Python loop over the pixels), the rest is computed in
+    float32, which is accurate to ~1e-7 here and twice as fast as float64.
+    """
+    window = min(SSIM_WINDOW, *reference.shape)
+    area = np.float32(window * window)
+    ssim_sum, window_count = 0.0, 0
+    for top in range(0, reference.shape[0] - window + 1, METRIC_STRIP_ROWS):
+        rows = slice(top, top + METRIC_STRIP_ROWS + window - 1)  # the windows starting in the strip
+        x, y = reference[rows].astype(np.int32), image[rows].astype(np.int32)
+
+        mean_x = _window_sums(x, window).astype(np.float32) / area
+        mean_y = _window_sums(y, window).astype(np.float32) / area
+        variance_x = _window_sums(x * x, window).astype(np.float32) / area - mean_x * mean_x
+        variance_y = _window_sums(y * y, window).astype(np.float32) / area - mean_y * mean_y
+        covariance = _window_sums(x * y, window).astype(np.float32) / area - mean_x * mean_y
+
+        ssim_map = ((2 * mean_x * mean_y + np.float32(SSIM_C1)) * (2 * covariance + np.float32(SSIM_C2))) / \
+                   ((mean_x * mean_x + mean_y * mean_y + np.float32(SSIM_C1)) *
+                    (variance_x + variance_y + np.float32(SSIM_C2)))
+        ssim_sum += float(ssim_map.sum(dtype=np.float64))
+        window_count += ssim_map.size
+    return ssim_sum / window_count
+
+
+def _window_sums(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum of every window x window block of a 2D array (output shrinks by window - 1)"""
+    height, width = values.shape[0] - window + 1, values.shape[1] - window + 1
+    row_sums = values[:height].copy()
+    for i in range(1, window):
+        row_sums += values[i:i + height]
+    sums = row_sums[:, :width].copy()
+    for i in range(1, window):
+        sums += row_sums[:, i:i + width]
+    return sums
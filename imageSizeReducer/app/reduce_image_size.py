@@ -1,11 +1,32 @@
 from PIL import Image
+import math
 import os
+import time
+from io import BytesIO
 from typing import List
-import tempfile
 
 from utility.logger_util.setup_logger import logger
 from utility import file_functions
 from utility import image_functions
+from utility.search_functions import bisect_highest_quality
+from utility.batch_scheduler import BatchJob, BatchScheduler
+from imageSizeReducer.app.encoders import ImageEncoder, get_encoder
+from imageSizeReducer.app import quality_metrics
+
+# Shortest side an image may be scaled down to
+MIN_SCALED_SIDE = 16
+# At quality 70 (encoders.SCALING_QUALITY), a JPEG takes at least about this many bytes per pixel (smooth
+# gradients; photos take 5 to 20 times more), so an image fitting the target size
+# has at most target / MIN_BYTES_PER_PIXEL pixels: no need to decode more
+MIN_BYTES_PER_PIXEL = 0.01
+# Downscaling first shrinks by an integer factor with reduce() (a fast box filter) down to
+# this many times the final size, then resamples with Lanczos: much faster on big images
+RESIZE_REDUCING_GAP = 2.0
+# Modes whose pixels can't be averaged (palette indexes, bits) or that reduce() doesn't
+# support: they are shrunk by keeping every n-th pixel instead
+PIXEL_PICKING_MODES = ('1', 'P', 'PA', 'I;16')
+# Batch mode: seconds between two progress reports
+PROGRESS_INTERVAL_SECONDS = 10
 
 """
 https://www.cic.gc.ca/english/helpcentre/answer.asp?qnum=1213
@@ -15,7 +36,23 @@ https://www.cic.gc.ca/english/helpcentre/answer.asp?qnum=1213
 
 
 class ImageSizeReducer:
-    def __init__(self, user_input: List[str], user_dest_path: str = '', reduction_quality_percentage: int = 0, target_image_size: float = 0.0):
+    def __init__(self, user_input: List[str], user_dest_path: str = '', reduction_quality_percentage: int = 0,
+                 target_image_size: float = 0.0, allow_scaling: bool = True, workers: int = 1,
+                 max_dimension: int = 0, transcode_to: str = '', min_ssim: float = 0.0, min_psnr: float = 0.0):
+        """
+        :param user_input: paths of images and directories of images
+        :param user_dest_path: directory of the reduced images, default: next to each image
+        :param reduction_quality_percentage: reduce the file size of each image by this %
+        :param target_image_size: target file size of each image in bytes (wins over the %)
+        :param allow_scaling: scale images down when no quality reaches the target size
+        :param workers: number of images reduced at the same time (processes)
+        :param max_dimension: longest side of the reduced images in pixels, 0 for no bound
+        :param transcode_to: 'jpeg' or 'webp' to write the images of formats without a size
+            setting (BMP, TIFF...) in that format, empty to keep their format
+        :param min_ssim: perceptual mode: write the smallest encoding whose SSIM against the
+            original is at least this (e.g. 0.95), instead of aiming at a file size
+        :param min_psnr: perceptual mode: same with the PSNR in dB (e.g. 40)
+        """
         self.user_input = user_input
         self.user_dest_path: str = user_dest_path
 
@@ -27,8 +64,23 @@ class ImageSizeReducer:
         if self.target_image_size and self.reduction_quality_percentage:
             logger.info(f"App chooses to use target_image_size={self.target_image_size} bytes")
 
+        self.allow_scaling = allow_scaling
+        self.workers = max(1, int(workers))
+        self.max_dimension = max(0, int(max_dimension))
+        self.transcode_to = transcode_to
+
+        self.min_ssim = min_ssim
+        self.min_psnr = min_psnr
+        self.perceptual_mode = bool(min_ssim or min_psnr)
+        if self.perceptual_mode and (self.target_image_size or self.reduction_quality_percentage):
+            logger.info(f"App chooses to use min_ssim={min_ssim}, min_psnr={min_psnr} instead of a target size")
+
     def process_user_request(self):
-        """Iterate over each input directory/PDFs and generate compressed PDF files"""
+        """Iterate over each input directory/images and generate reduced image files"""
+        if self.workers > 1:
+            self._process_batch()
+            return
+
         for input_path in self.user_input:
             input_path = input_path.strip()
             if not os.path.exists(input_path):
@@ -43,6 +95,50 @@ class ImageSizeReducer:
                 self._process_directory(input_directory=input_path)
                 logger.info(f"SUCCESS: Directory {input_path} processed.\n")
 
+    def _process_batch(self):
+        """
+        Reduce all images of all input paths with a pool of 'workers' processes.
+
+        The list of images is built first (one directory walk), then the images are
+        scheduled largest first. A file that fails is reported and the batch goes on.
+        Progress and throughput are logged every PROGRESS_INTERVAL_SECONDS, and a
+        summary at the end.
+        """
+        jobs = [BatchJob(path=image_path, size_in_bytes=file_functions.get_file_size_in_bytes(image_path))
+                for image_path in image_functions.plan_image_files(self.user_input)]
+        logger.info(f"Reducing {len(jobs)} images with {self.workers} processes")
+
+        start_time = last_report_time = time.perf_counter()
+        reduced_count = unreachable_count = failed_count = 0
+        input_bytes = output_bytes = 0
+        for done_count, batch_result in enumerate(
+                BatchScheduler(workers=self.workers).run(self.reduce_single_image_file_size, jobs), start=1):
+            if batch_result.result:
+                reduced_count += 1
+                input_bytes += batch_result.job.size_in_bytes
+                output_bytes += file_functions.get_file_size_in_bytes(batch_result.result)
+            elif batch_result.error:  # logged by the scheduler
+                failed_count += 1
+            else:  # logged by reduce_single_image_file_size
+                unreachable_count += 1
+
+            now = time.perf_counter()
+            if now - last_report_time >= PROGRESS_INTERVAL_SECONDS or done_count == len(jobs):
+                last_report_time = now
+                self._log_progress(done_count, len(jobs), now - start_time)
+
+        logger.info(f"Batch summary: {reduced_count} reduced, {unreachable_count} above target size, "
+                    f"{failed_count} failed in {time.perf_counter() - start_time:.1f} seconds; "
+                    f"{input_bytes / 2 ** 20:.1f} MB reduced to {output_bytes / 2 ** 20:.1f} MB\n")
+
+    @staticmethod
+    def _log_progress(done_count: int, total_count: int, elapsed_seconds: float):
+        """Log the images done so far, the throughput and the estimated time left"""
+        images_per_second = done_count / elapsed_seconds if elapsed_seconds else 0
+        seconds_left = (total_count - done_count) / images_per_second if images_per_second else 0
+        logger.info(f"Progress: {done_count}/{total_count} images, {images_per_second:.1f} images/second, "
+                    f"about {seconds_left:.0f} seconds left")
+
     def _process_directory(self, input_directory: str):
         """Notice, it's a recursive function.
 
@@ -76,38 +172,245 @@ class ImageSizeReducer:
         return compress_file_size_in_byte
 
     def reduce_single_image_file_size(self, input_path):
+        """
+        Write a copy of an image that fits the target size (or, in perceptual mode, the
+        smallest copy keeping min_ssim / min_psnr, see _encode_to_quality).
 
-        # Calculate the target file size based on the reduction percentage / target size
-        target_img_size = self.calculate_compress_image_size_in_bytes(input_path)
+        The image is decoded at the smallest resolution the output may need (see
+        _decode_for_target), then encoded in memory only by the encoder of its format
+        (see encoders.py): its level (quality, colors) is found by bisection and, if
+        even the lowest level is too large, the image is scaled down as well (unless
+        allow_scaling is False). The chosen encoding is written as is.
+
+        :param input_path: path of the image
+        :return: path of the reduced image, None if the target size can't be reached
+        """
         file_extension, _ = file_functions.get_file_extension(input_path)
+        image_format = Image.registered_extensions().get(file_extension.lower())
+
+        with Image.open(input_path) as image:
+            encoder = get_encoder(image.format or image_format, self.transcode_to)
+            original_width = image.width
+
+            if self.perceptual_mode:
+                # no target size: only max_dimension may shrink the image, and the copy must
+                # be smaller than the original to be of any use
+                target_img_size = file_functions.get_file_size_in_bytes(input_path)
+                decoded_image, _ = self._decode_for_target(image, math.inf)
+                image_bytes, level, image_quality, encode_count = self._encode_to_quality(decoded_image, encoder)
+                scale = 1.0
+            else:
+                # Calculate the target file size based on the reduction percentage / target size
+                target_img_size = self.calculate_compress_image_size_in_bytes(input_path)
+                decoded_image, decoded_for_target = self._decode_for_target(image, target_img_size)
+                # an image decoded smaller for the target size is scaled already: keep a good quality
+                image_bytes, level, scale, encode_count = self._encode_to_target(
+                    decoded_image, encoder, target_img_size,
+                    min_level=encoder.scaling_level if decoded_for_target else encoder.min_level)
+            scale *= decoded_image.width / original_width
+
+        if len(image_bytes) > target_img_size or (self.perceptual_mode and len(image_bytes) == target_img_size):
+            if self.perceptual_mode:
+                logger.warning(f"File {input_path}: no encoding smaller than the original keeps "
+                               f"SSIM {image_quality.ssim:.4f}, PSNR {image_quality.psnr:.1f} dB")
+            else:
+                logger.warning(f"File {input_path}: not possible to reduce quality. "
+                               f"Decrease reduction in quality")
+            return None
+
+        # a transcoded image gets the extension of its new format
+        output_extension = file_extension if encoder.format == image_format else encoder.extension
+        output_path = self._write_new_file(
+            self.get_output_path(input_path, encoder.get_label(level), output_extension), image_bytes)
+
+        logger.debug(f"{output_path}: {encoder.format} level {level}, scale {scale:.2f}, {len(image_bytes)} bytes, "
+                     f"{encode_count} encodes")
+        if self.perceptual_mode:
+            logger.info(f"{output_path}: SSIM {image_quality.ssim:.4f}, PSNR {image_quality.psnr:.1f} dB, "
+                        f"{len(image_bytes)} bytes ({100 * len(image_bytes) / target_img_size:.0f}% of the original)")
+        return output_path
+
+    def _encode_to_quality(self, image: Image.Image, encoder: ImageEncoder):
+        """
+        Encode an image in memory at the lowest level of the encoder whose SSIM and PSNR
+        against the image are at least min_ssim and min_psnr.
+
+        The metrics grow with the level like the file size does, so the same bisection
+        is used, on the reversed levels (the lowest passing level is the highest
+        passing 'min_level + max_level - level'). Each candidate is decoded back and
+        compared on its luma at full resolution, see quality_metrics.
+
+        :param image: PIL image
+        :param encoder: encoder of the output format
+        :return: (encoded bytes, level, quality_metrics.ImageQuality, number of encodes);
+            the encoding at max_level when no level passes
+        """
+        reference_luma = quality_metrics.get_luma(image)
+        encoded = {}  # level -> (bytes, ImageQuality)
+
+        def encode(level: int):
+            if level not in encoded:
+                image_bytes = encoder.encode(image, level)
+                with Image.open(BytesIO(image_bytes)) as encoded_image:
+                    encoded[level] = image_bytes, quality_metrics.compare(reference_luma, encoded_image)
+            return encoded[level]
+
+        def keeps_quality(level: int) -> bool:
+            image_quality = encode(level)[1]
+            return image_quality.ssim >= self.min_ssim and image_quality.psnr >= self.min_psnr
+
+        level_sum = encoder.min_level + encoder.max_level
+        reversed_level, _ = bisect_highest_quality(lambda lv: keeps_quality(level_sum - lv),
+                                                   min_quality=encoder.min_level, max_quality=encoder.max_level)
+        level = encoder.max_level if reversed_level is None else level_sum - reversed_level
+
+        image_bytes, image_quality = encode(level)
+        return encoder.finish(image, level, image_bytes), level, image_quality, len(encoded)
+
+    def _decode_for_target(self, image: Image.Image, target_size: float):
+        """
+        Decode an image at a fraction of its resolution when the output can't use all of it.
+
+        The output has at most max_dimension on its longest side and, when scaling is
+        allowed, at most target_size / MIN_BYTES_PER_PIXEL pixels. JPEGs are then
+        decoded at 1/2, 1/4 or 1/8 scale by the decoder itself (draft mode), which is
+        several times faster and smaller than decoding every pixel; other formats are
+        shrunk by an integer factor with reduce() (or by picking pixels for the modes
+        in PIXEL_PICKING_MODES). The result is never smaller than
+        the output may need, except that it's fitted in max_dimension.
+
+        :param image: image opened with Image.open, not loaded yet
+        :param target_size: target size in bytes
+        :return: (the image (loaded or not) or a smaller copy of it, True if it was
+            decoded smaller because of the target size)
+        """
+        width, height = image.size
+        dimension_scale = min(1.0, self.max_dimension / max(width, height)) if self.max_dimension else 1.0
+        target_scale = math.sqrt(target_size / MIN_BYTES_PER_PIXEL / (width * height)) if self.allow_scaling else 1.0
+        scale = min(dimension_scale, target_scale)
+        if scale >= 1:
+            return image, False
+
+        needed_size = (max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale)))
+        image.draft(image.mode, needed_size)  # no-op for formats other than JPEG
+        reduce_factor = min(image.width // needed_size[0], image.height // needed_size[1])
+        if reduce_factor >= 2:
+            if image.mode in PIXEL_PICKING_MODES:
+                image = image.resize((image.width // reduce_factor, image.height // reduce_factor), Image.NEAREST)
+            else:
+                image = image.reduce(reduce_factor)
+        # only an image actually decoded smaller (not when draft() and reduce() had nothing
+        # to do) is scaled already, and only then because of the target size
+        decoded_for_target = image.size != (width, height) and target_scale < dimension_scale
+
+        if self.max_dimension and max(image.size) > self.max_dimension:
+            fit_scale = self.max_dimension / max(image.size)
+            image = self._resize(image, (max(1, round(image.width * fit_scale)),
+                                         max(1, round(image.height * fit_scale))))
+        return image, decoded_for_target
+
+    @staticmethod
+    def _resize(image: Image.Image, size: tuple) -> Image.Image:
+        """Resample an image with Lanczos, shrinking it with reduce() first when its mode allows it"""
+        reducing_gap = None if image.mode in PIXEL_PICKING_MODES else RESIZE_REDUCING_GAP
+        return image.resize(size, Image.LANCZOS, reducing_gap=reducing_gap)
 
-        image = Image.open(input_path)
+    def _encode_to_target(self, image: Image.Image, encoder: ImageEncoder, target_size: float,
+                          min_level: int = None):
+        """
+        Encode an image in memory with the highest level of the encoder that fits in target_size.
+
+        The file size grows (almost) monotonically with the level (quality, colors),
+        so the level is bisected. When nothing fits, the scale is bisected too: the
+        largest scale (in %) fitting at the encoder's scaling_level is found, then the
+        highest level at that scale. Encodings are kept, so the chosen one is never
+        encoded twice (unless the encoder writes it with slower settings, see
+        ImageEncoder.finish).
+
+        :param image: PIL image
+        :param encoder: encoder of the output format
+        :param target_size: target size in bytes
+        :param min_level: lowest level tried before scaling the image down, default:
+            encoder.min_level
+        :return: (encoded bytes, level, scale, number of encodes); the bytes are the
+            smallest encoding found when none fits
+        """
+        min_level = encoder.min_level if min_level is None else min_level
+        encoded = {}  # (scale %, level) -> bytes
+        scaled_image = {100: image}  # only the image of the last scale is kept
 
-        # Save the image with optimized compression at different quality levels
-        with tempfile.TemporaryDirectory() as temp_dir:
-            for quality in range(98, 2, -2):
+        def get_scaled_image(percent: int) -> Image.Image:
+            if percent not in scaled_image:
+                scaled_image.clear()
+                scaled_image[percent] = self._resize(image, (max(1, image.width * percent // 100),
+                                                             max(1, image.height * percent // 100)))
+            return scaled_image[percent]
 
-                temp_img_path = os.path.join(temp_dir, f'temp_{file_extension}')
-                image.save(temp_img_path, optimize=True, quality=quality)
+        def encode(percent: int, level: int) -> bytes:
+            if (percent, level) not in encoded:
+                encoded[(percent, level)] = encoder.encode(get_scaled_image(percent), level)
+            return encoded[(percent, level)]
 
-                temp_img_size = file_functions.get_file_size_in_bytes(temp_img_path)
-                if temp_img_size <= target_img_size:
-                    # todo: write a function to get unique name for img
-                    output_path = self.get_output_path(input_path, quality)
-                    image.save(output_path, optimize=True, quality=quality)
-                    return output_path
+        def highest_level(percent: int, lowest_level: int):
+            # from the scaling level, the lowest level is encoded already or likely too large:
+            # try it first, no higher level fits if it doesn't
+            if lowest_level >= encoder.scaling_level and len(encode(percent, lowest_level)) > target_size:
+                return None
+            level, _ = bisect_highest_quality(lambda lv: len(encode(percent, lv)) <= target_size,
+                                              min_quality=lowest_level, max_quality=encoder.max_level)
+            return level
 
-        logger.warning(f"File {input_path}: not possible to reduce quality. "
-                       f"Decrease reduction in quality")
-        return None
+        percent = 100
+        level = highest_level(percent, min_level)
+        min_percent = math.ceil(100 * MIN_SCALED_SIDE / max(1, min(image.size)))
 
-    def get_output_path(self, input_path, quality):
+        if level is None and self.allow_scaling and min_percent < 100:
+            percent, _ = bisect_highest_quality(lambda p: len(encode(p, encoder.scaling_level)) <= target_size,
+                                                min_quality=min_percent, max_quality=99)
+            if percent is not None:
+                level = highest_level(percent, encoder.scaling_level)
+            else:  # even the smallest image is too large at the scaling level
+                percent = min_percent
+                level = highest_level(percent, encoder.min_level)
+
+        if level is None:
+            percent, level = min(encoded, key=lambda key: len(encoded[key]))
+        image_bytes = encoder.finish(get_scaled_image(percent), level, encode(percent, level))
+        return image_bytes, level, percent / 100, len(encoded)
+
+    @staticmethod
+    def _write_new_file(file_path: str, file_bytes: bytes) -> str:
+        """
+        Write bytes to file_path, or to a unique path next to it if the file exists.
+        The file is created exclusively, so processes of a batch writing into the
+        same directory never overwrite each other.
+
+        :return: path of the written file
+        """
+        file_functions.create_directory(file_functions.get_directory_name(file_path))
+        while True:
+            try:
+                with open(file_path, 'xb') as f:
+                    f.write(file_bytes)
+                return file_path
+            except FileExistsError:
+                file_path = file_functions.get_unique_filepath_in_same_dir(file_path)
+
+    def get_output_path(self, input_path, label, extension=''):
+        """
+        :param input_path: path of the image
+        :param label: what the file name starts with, such as 'Q80' (see ImageEncoder.get_label)
+        :param extension: extension of the output file, default: the one of the image
+        :return: unique path of the reduced image
+        """
         # todo: rewrite it as 'get_unique_path_for_compressed_pdf' is defined in file 'compressPDF/app/pdf_compressor.py'
         dest_dir = self.user_dest_path if self.user_dest_path else \
             file_functions.get_directory_name(input_path)
 
         file_name = file_functions.get_file_name(input_path)
-        file_name = f'Q{quality}_{file_name}'
+        if extension:
+            file_name = os.path.splitext(file_name)[0] + extension
+        file_name = f'{label}_{file_name}'
         file_path = os.path.join(dest_dir, file_name)
         file_path = file_functions.get_unique_filepath_in_same_dir(file_path)
         return file_path
@@ -123,7 +426,3 @@ class ImageSizeReducer:
 # else:
 #     print("Failed to compress image within the specified reduction percentage.")
 
-
-aa = ImageSizeReducer(user_input=[r'C:\Users\MANTKUMAR\Downloads\experiments\mk'],user_dest_path=r'C:\Users\MANTKUMAR\Downloads\experiments\output')
-import pdb;pdb.set_trace()
-aa.process_user_request()
@@ -1,68 +1,68 @@
-from PIL import Image
-import os
-import pathlib
-from typing import List
-
-from utility.logger_util.setup_logger import logger
-
-
-
-
-
-
-# Example usage
-# input_path = 'path/to/your/image.jpg'
-# input_path = r'C:\Users\MANTKUMAR\Documents\mantosh-backup-gdrive\101-family-safe-backup\inLaw-personal-documents\document bank\manisha docs\manisha last 4 months bank statements\chequing account\pdf-snapshots\New folder\chequing-april-2023-page-1.jpg'
-input_path = r'C:\Users\MANTKUMAR\Downloads\experiments'
-reduction_percentage = 20  # Reduce file size by 20%
-
-output_path = reduce_image_file_size(input_path, reduction_percentage)
-if output_path:
-    print(f"Compressed image saved at: {output_path}")
-else:
-    print("Failed to compress image within the specified reduction percentage.")
-
-
-
-
-
-##########################3
+import argparse
+import os, sys
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-import argparse
 from imageSizeReducer.app.reduce_image_size import ImageSizeReducer
+from imageSizeReducer.app.encoders import TRANSCODE_FORMATS
 from utility.user_input_functions import get_clean_user_input_paths, get_clean_user_output_path
 
 
 def run_app():
-    parser = argparse.ArgumentParser(description="PDF Compressor")
-    parser.add_argument("--input-paths", type=str, help="Paths to the input PDFs or directories separated by commas", required=True)
-    parser.add_argument("--dest-dir", type=str, help="Optional destination directory path to store the compressed PDF", default='')
-    parser.add_argument("--target-pdf-size", type=int, help="Optional: Enter target size in MB for each compressed PDF", required=True)
+    parser = argparse.ArgumentParser(description="Image Size Reducer")
+    parser.add_argument("--input-paths", type=str,
+                        help="Paths to the input images or directories separated by commas", required=True)
+    parser.add_argument("--dest-dir", type=str,
+                        help="Optional destination directory path to store the reduced images", default='')
+    parser.add_argument("--reduction-percentage", type=int, default=0,
+                        help="Optional: Reduce the file size of each image by this percentage. Default=0")
+    parser.add_argument("--target-image-size", type=float, default=0,
+                        help="Optional: Target size in KB of each reduced image, wins over --reduction-percentage. "
+                             "Default=0")
+    parser.add_argument("--min-ssim", type=float, default=0,
+                        help="Optional: Perceptual mode: write the smallest copy whose SSIM against the original is "
+                             "at least this (0-1, e.g. 0.95), instead of aiming at a file size. Default=0 (off)")
+    parser.add_argument("--min-psnr", type=float, default=0,
+                        help="Optional: Perceptual mode: same with the PSNR in dB (e.g. 40). Default=0 (off)")
+    parser.add_argument("--no-scaling", action="store_true",
+                        help="Optional: Never scale images down, only lower their quality")
+    parser.add_argument("--max-dimension", type=int, default=0,
+                        help="Optional: Longest side of the reduced images in pixels. Default=0 (no bound)")
+    parser.add_argument("--transcode", type=str, choices=TRANSCODE_FORMATS, default='',
+                        help="Optional: Write images of formats without a size setting (BMP, TIFF, ...) as 'jpeg' "
+                             "or 'webp'. Default: keep their format, only scale them down")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Optional: Number of images reduced at the same time (processes, largest first). "
+                             "Default=1")
     args = parser.parse_args()
 
-    # todo (02 Mar 2024): May be add an attribute 'memory_unit' and provide options
-    #  for 'MB' and 'KB'. By default, make it MB. Currently app assumes value provided
-    #  in 'target-pdf-size' is in MB. Since this argument works best if input is int so
-    #  those files which are in KB cannot used this application. Think about them.
+    if not any((args.reduction_percentage, args.target_image_size, args.max_dimension, args.min_ssim,
+                args.min_psnr)):
+        parser.error("give --reduction-percentage, --target-image-size, --min-ssim, --min-psnr or --max-dimension")
+    if not 0 <= args.min_ssim <= 1:
+        parser.error("--min-ssim must be between 0 and 1")
+    if not 0 <= args.reduction_percentage < 100:
+        parser.error("--reduction-percentage must be between 0 and 99")
 
     # Clean user-inputs, don't blindly trust user.
-    input_dirs = get_clean_user_input_paths(user_input=args.input_paths)  # list of str
+    input_paths = get_clean_user_input_paths(user_input=args.input_paths)  # list of str
     dest_dir = get_clean_user_output_path(user_input=args.dest_dir)  # str
 
-    target_pdf_size = args.target_pdf_size
-
     # Sample Run
-    # input_dirs = [r'C:\\Users\\MANTOSH\\Downloads', r'C:\\Users\\MANTOSH\\Downloads\\sample.pdf']
-    # dest_dir = r'C:\Users\MANTOSH\Downloads\del'
-    # target_pdf_size = 2 # in MB
-
-    # pdf_compressor = PDFCompressor(user_input=input_dirs, user_dest_dir=dest_dir, target_pdf_size=target_pdf_size)
-    # pdf_compressor.process_user_request()
-
-    aa = ImageSizeReducer(user_input=[r'C:\Users\MANTKUMAR\Downloads\experiments\mk'],
-                          user_dest_path=r'C:\Users\MANTKUMAR\Downloads\experiments\output')
-    aa.process_user_request()
+    # input_paths = [r'C:\\Users\\MANTOSH\\Downloads\\experiments', r'C:\\Users\\MANTOSH\\Downloads\\photo.jpg']
+    # dest_dir = r'C:\Users\MANTOSH\Downloads\experiments\output'
+    # reduction_percentage = 20  # Reduce file size by 20%
+
+    image_size_reducer = ImageSizeReducer(user_input=input_paths, user_dest_path=dest_dir,
+                                          reduction_quality_percentage=args.reduction_percentage,
+                                          target_image_size=args.target_image_size * 1024,
+                                          allow_scaling=not args.no_scaling,
+                                          workers=args.workers,
+                                          max_dimension=args.max_dimension,
+                                          transcode_to=args.transcode,
+                                          min_ssim=args.min_ssim,
+                                          min_psnr=args.min_psnr)
+    image_size_reducer.process_user_request()
 
 
 if __name__ == "__main__":
@@ -1,12 +1,37 @@
 import os
+import re
 
-import pdf2image
-from typing import List
-from PIL import Image
+from typing import List, Optional, Tuple
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
 
 from utility.logger_util.setup_logger import logger
 from utility import pdf_functions
+from utility.search_functions import bisect_highest_quality
+from utility.rasterizer import DEFAULT_RASTERIZER, PdfInfo, RasterizerError, get_rasterizer
+
+# Pages of a PDF rendered, encoded and written together. Only this many pages of a
+# PDF are held in memory at a time by each worker, whatever the size of the PDF.
+SNAPSHOT_BATCH_PAGES = 4
+# Highest JPEG quality of a snapshot; the quality given by the user is the lowest one
+MAX_SNAPSHOT_QUALITY = 90
+# Rendering resolution of the pages when no thumbnail size is given
+SNAPSHOT_DPI = 200
+
+
+def parse_thumbnail_size(thumbnail: str) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    """Parse a thumbnail size such as '320x240', '320x' (width only) or 'x240' (height only)
+    :param thumbnail: (str) 'WxH', empty for no thumbnail
+    :returns (width, height) where a missing side is None, or None for no thumbnail
+    :raises ValueError: for a malformed size
+    """
+    if not thumbnail.strip():
+        return None
+
+    match = re.fullmatch(r'(\d*)[xX](\d*)', thumbnail.strip())
+    if not match or not any(match.groups()) or '0' in (match.group(1), match.group(2)):
+        raise ValueError(f"invalid thumbnail size '{thumbnail}', expected e.g. '320x240', '320x' or 'x240'")
+    return int(match.group(1)) if match.group(1) else None, int(match.group(2)) if match.group(2) else None
 
 
 class PDFSnapshotGenerator:
@@ -39,92 +64,157 @@ class PDFSnapshotGenerator:
            of input directories as a parameter.
         2. Call the generate_snapshots method to start the generation process.
     """
-    def __init__(self, user_input: List[str], user_dest_path: str = '', quality=20):
+    def __init__(self, user_input: List[str], user_dest_path: str = '', quality=20, workers: int = 1,
+                 pages: str = '', thumbnail: str = '', dpi: int = SNAPSHOT_DPI,
+                 rasterizer: str = DEFAULT_RASTERIZER):
         """
         :param user_input (list): A list of input directories/PDFs where the PDF files are located.
         :param user_dest_path (str): User specified optional destination directory to store generated images
         :param quality: (int) Quality percentage of generated images
+        :param workers: (int) Number of processes rendering and encoding pages in parallel
+        :param pages: (str) Pages to snapshot such as '1,3-5,-1' (-1 is the last page), empty for all pages
+        :param thumbnail: (str) Fit the snapshots in this size such as '320x240', '320x' or 'x240'
+        :param dpi: (int) Rendering resolution of the pages, ignored for thumbnails
+        :param rasterizer: (str) Backend rendering the pages: 'poppler' (pdf2image) or 'fitz' (PyMuPDF)
         """
         self.user_input = user_input
         self.user_dest_path: str = user_dest_path
         self.quality = int(quality)
+        self.workers = max(1, int(workers))
+        self.page_ranges = pdf_functions.parse_page_ranges(pages) if pages.strip() else None
+        self.thumbnail_size = parse_thumbnail_size(thumbnail)
+        self.dpi = int(dpi)
+        self.rasterizer = get_rasterizer(rasterizer)
 
     def generate_pdf_snapshots(self):
         """Iterate over each input directory/PDFs and generate JPEG image of each page in PDF files"""
-        for input_path in self.user_input:
-            input_path = input_path.strip()
-            if not os.path.exists(input_path):
-                logger.error(f"ERROR: input path {input_path} does not exist.\n")
-                continue
-
-            # if not PDF neither a directory
-            if not pdf_functions.is_pdf_or_directory(file_path=input_path):
-                continue
-
-            if PDFSnapshotGenerator.is_file(input_path, file_extension='.pdf'):
-                self._generate_pdf_snapshots(pdf_file_path=input_path)
-            else:  # Directory
-                self._process_directory(input_directory=input_path)
-            logger.info(f"SUCCESS: {input_path} processed.\n")
-
-    def _generate_pdf_snapshots(self, pdf_file_path: str):
-        """Generate JPEG image of each page within the PDF files
-        :param pdf_file_path (<str>): A path to a PDF file to process.
-        """
-        if not os.path.exists(pdf_file_path):
-            logger.error(f"ERROR: PDF {pdf_file_path} does not exist")
-            return
-        image_objects = self._convert_pdf_to_images(pdf_path=pdf_file_path)
-        self._save_images(image_objects=image_objects, pdf_path=pdf_file_path)
+        # plan all the work first: every directory is walked once, every PDF is processed once
+        pdf_file_paths = pdf_functions.plan_pdf_files(self.user_input)
+        logger.info(f"{len(pdf_file_paths)} PDF files to process\n")
+
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                self._process_pdfs_files(pdf_file_paths=pdf_file_paths, executor=executor)
+        else:
+            self._process_pdfs_files(pdf_file_paths=pdf_file_paths, executor=None)
 
-    def _process_pdfs_files(self, pdf_file_paths: List[str]):
+    def _process_pdfs_files(self, pdf_file_paths: List[str], executor=None):
         """Process each PDF file to generate JPEG image of each page within the PDF.
+
+        Pages are rendered, encoded and written in batches of SNAPSHOT_BATCH_PAGES,
+        so memory stays flat whatever the number of pages. With an executor, the
+        batches of all PDFs are queued at once and processed in parallel by its
+        worker processes, so no worker waits for the last pages of a PDF.
+
         :param pdf_file_paths (list <str>): A list of paths to the PDF files to process.
+        :param executor: process pool to render the pages with, None to render in this process
         """
+        planned_pdfs = []  # (PDF path, page ranges)
         for pdf_file_path in pdf_file_paths:
-            if not os.path.exists(pdf_file_path):
-                logger.error(f"ERROR: PDF {pdf_file_path} does not exist")
-                continue
-            self._generate_pdf_snapshots(pdf_file_path=pdf_file_path)
-
-    def _process_directory(self, input_directory: str):
-        """Process a single input directory by finding PDF files and then generating
-        snapshots of each PDF and subsequently processing the sub-directories of the
-        input directory as well.
-        :param input_directory (str): The path to the input directory.
-        """
-        pdf_file_paths = self._find_pdf_files(directory=input_directory)
-        self._process_pdfs_files(pdf_file_paths=pdf_file_paths)
-        self._process_subdirectories(directory=input_directory)
-
-    @classmethod
-    def _find_pdf_files(cls, directory: str) -> list:
-        """Finds all PDF files within a given directory, including subdirectories.
-        :param directory (str): The path to the directory to search for PDF files.
-        :returns A list of paths to the PDF files found in a directory.
+            try:
+                planned_pdfs.append((pdf_file_path, self._plan_page_ranges(pdf_file_path)))
+            except RasterizerError as e:
+                logger.error(f"ERROR: skipping encrypted or unreadable PDF {pdf_file_path}: {e}")
+
+        if executor is None:
+            for pdf_file_path, page_ranges in planned_pdfs:
+                encode_counts = [count for page_range in page_ranges
+                                 for count in self._generate_page_range_snapshots(pdf_file_path, *page_range)]
+                self._log_pdf_processed(pdf_file_path, encode_counts)
+            return
+
+        futures_of_pdfs = [(pdf_file_path,
+                            [executor.submit(self._generate_page_range_snapshots, pdf_file_path, *page_range)
+                             for page_range in page_ranges])
+                           for pdf_file_path, page_ranges in planned_pdfs]
+        for pdf_file_path, futures in futures_of_pdfs:
+            # raises the error of a failed batch, if any
+            encode_counts = [count for future in futures for count in future.result()]
+            self._log_pdf_processed(pdf_file_path, encode_counts)
+
+    def _plan_page_ranges(self, pdf_file_path: str) -> List[tuple]:
+        """Split the selected pages of a PDF into batches of at most SNAPSHOT_BATCH_PAGES
+        consecutive pages (each batch is rendered by one rasterizer call)
+        :param pdf_file_path (<str>): A path to a PDF file to process.
+        :returns list of (first page, last page, page count of the PDF, render size)
+        :raises RasterizerError: if the PDF cannot be read
         """
-        pdf_file_paths = []
-        for root, _, files in os.walk(directory):
-            for file in files:
-                if file.endswith('.pdf'):
-                    pdf_file_paths.append(os.path.join(root, file))
-        return pdf_file_paths
-
-    def _process_subdirectories(self, directory: str):
-        """Process subdirectories within the given directory
-        :param directory (str): The path to the directory to process.
+        pdf_info = self.rasterizer.get_pdf_info(pdf_file_path)
+        page_count = pdf_info.page_count
+        render_size = self._get_render_size(pdf_info=pdf_info)
+        self._get_output_directory(pdf_path=pdf_file_path)  # create it once, before the workers write in it
+
+        selected_pages = range(1, page_count + 1) if self.page_ranges is None else \
+            pdf_functions.select_pages(self.page_ranges, page_count)
+
+        batches = []  # [first page, last page]
+        for page in selected_pages:
+            if batches and page == batches[-1][1] + 1 and page - batches[-1][0] < SNAPSHOT_BATCH_PAGES:
+                batches[-1][1] = page
+            else:
+                batches.append([page, page])
+
+        return [(first_page, last_page, page_count, render_size) for first_page, last_page in batches]
+
+    def _get_render_size(self, pdf_info: PdfInfo) -> Optional[tuple]:
+        """Return the size argument of the rasterizer for the thumbnail size, None to render at self.dpi.
+
+        The rasterizers stretch the pages when given both sides, so only the side
+        which limits the page (as proportioned as the first page) is passed; the
+        other one follows the aspect ratio of the page.
+
+        :param pdf_info (PdfInfo): page count and size of the PDF
         """
-        for root, dirs, _ in os.walk(directory):
-            for dir_name in dirs:
-                self._process_directory(os.path.join(root, dir_name))
+        if self.thumbnail_size is None:
+            return None
+
+        box_width, box_height = self.thumbnail_size
+        if box_width is None or box_height is None or not pdf_info.page_width or not pdf_info.page_height:
+            return box_width, box_height
 
-    @classmethod
-    def _convert_pdf_to_images(cls, pdf_path: str) -> list:
-        """Convert each page of the PDF to a list of PIL Image objects
+        if pdf_info.page_width * box_height >= pdf_info.page_height * box_width:  # wider than the box
+            return box_width, None
+        return None, box_height
+
+    @staticmethod
+    def _log_pdf_processed(pdf_file_path: str, encode_counts: List[int]):
+        """:param encode_counts: number of JPEG encodes of each saved page"""
+        if not encode_counts:
+            logger.warning(f"{pdf_file_path}: none of the selected pages is in the PDF")
+            return
+        logger.info(f"{pdf_file_path}: {len(encode_counts)} pages saved with {sum(encode_counts)} JPEG "
+                    f"encodes ({sum(encode_counts) / len(encode_counts):.1f} per page)")
+        logger.info(f"SUCCESS: {pdf_file_path} processed.\n")
+
+    def _generate_page_range_snapshots(self, pdf_path: str, first_page: int, last_page: int,
+                                       page_count: int, render_size: tuple = None) -> List[int]:
+        """Render a range of pages of a PDF and save their JPEG images (runs in a worker process)
+        :param pdf_path (str): The path to the PDF file.
+        :param first_page (int): First page of the range (1-based).
+        :param last_page (int): Last page of the range (inclusive).
+        :param page_count (int): Number of pages of the whole PDF.
+        :param render_size (tuple): size argument of pdf2image, None to render at self.dpi
+        :returns number of JPEG encodes of each saved page
+        """
+        image_objects = self._convert_pdf_to_images(pdf_path=pdf_path, first_page=first_page, last_page=last_page,
+                                                    size=render_size)
+        if self.thumbnail_size and None not in self.thumbnail_size:
+            for image in image_objects:  # pages proportioned unlike the first page
+                image.thumbnail(self.thumbnail_size)
+        return self._save_images(image_objects=image_objects, pdf_path=pdf_path,
+                                 first_page=first_page, page_count=page_count)
+
+    def _convert_pdf_to_images(self, pdf_path: str, first_page: int = None, last_page: int = None,
+                               size: tuple = None) -> list:
+        """Convert pages of the PDF to a list of PIL Image objects
         :param pdf_path (str): The path to the PDF file to convert.
+        :param first_page (int): First page to convert (1-based), default: first page of the PDF
+        :param last_page (int): Last page to convert (inclusive), default: last page of the PDF
+        :param size (tuple): (width, height) to render the pages at, None to render at self.dpi
         :returns A list of PIL Image objects representing each page of the PDF.
         """
-        return pdf2image.convert_from_path(pdf_path)
+        return self.rasterizer.convert(pdf_path, dpi=self.dpi, first_page=first_page, last_page=last_page,
+                                       size=size)
 
     @staticmethod
     def is_file(path, file_extension='.pdf') -> bool:
@@ -146,7 +236,19 @@ class PDFSnapshotGenerator:
         # must be directory or file with non-expected extension
         return False
 
-    def _save_images(self, image_objects: list, pdf_path: str):
+    def _get_output_directory(self, pdf_path: str) -> str:
+        """Return (and create if needed) the directory where the snapshots of a PDF are stored"""
+        output_directory = self.user_dest_path if self.user_dest_path else \
+            os.path.join(os.path.dirname(pdf_path), 'pdf-snapshots')
+
+        # Create pdf-snapshots directory if it doesn't exist
+        if not os.path.exists(output_directory):
+            os.makedirs(output_directory, exist_ok=True)
+            logger.info(f"SUCCESS: output directory {output_directory} created\n")
+        return output_directory
+
+    def _save_images(self, image_objects: list, pdf_path: str, first_page: int = 1,
+                     page_count: int = None) -> List[int]:
         """Save each image with the file name and page number.
 
         How naming of each PDF page is decided:
@@ -160,54 +262,65 @@ class PDFSnapshotGenerator:
 
         :param image_objects (list): A list of PIL Image objects representing the converted images of each pages of the PDF.
         :param pdf_path (str): The path to the original PDF file. Used for naming the output images.
+        :param first_page (int): Page number of the first image (when saving a range of pages).
+        :param page_count (int): Number of pages of the whole PDF, default: number of images.
+        :returns number of JPEG encodes of each saved page
         """
         src_filename = os.path.basename(pdf_path)
-        output_directory = self.user_dest_path if self.user_dest_path else \
-            os.path.join(os.path.dirname(pdf_path), 'pdf-snapshots')
+        output_directory = self._get_output_directory(pdf_path)
 
-        # Create pdf-snapshots directory if it doesn't exist
-        if not os.path.exists(output_directory):
-            os.makedirs(output_directory, exist_ok=True)
-            logger.info(f"SUCCESS: output directory {output_directory} created\n")
+        # keep each PDF page size less or equal to the original PDF file's page
+        num_pages = page_count or len(image_objects)
+        page_size = os.path.getsize(pdf_path) // num_pages  # bytes
 
-        num_pages = len(image_objects)
-        for i, image in enumerate(image_objects):
+        encode_counts = []
+        for i, image in enumerate(image_objects, start=first_page - 1):
             # strip extension (.pdf) from filename
             src_filename_without_extension, _ = os.path.splitext(src_filename)
             dest_image_path = os.path.join(output_directory, f"{src_filename_without_extension}-page-{i + 1}.jpg")
-            image.save(dest_image_path, "JPEG")
-
-            # keep each PDF page size less or equal to the original PDF file's page
-            page_size = os.path.getsize(pdf_path) // num_pages  # bytes
-            self.reduce_image_file_size(image_path=dest_image_path, target_size=page_size)
 
-    def reduce_image_file_size(self, image_path: str, target_size: int):
-        """This function reduces the file size of an image while maintaining visual
-        quality. It uses iterative JPEG compression with dynamically adjusted quality
-        levels to achieve the desired file size reduction.
+            jpeg_bytes, quality, encode_count = self._encode_image(image=image, target_size=page_size)
+            with open(dest_image_path, 'wb') as f:
+                f.write(jpeg_bytes)
 
-        @:param image_path (str): The path of the image file.
-        @:param target_size (int): The desired target size in bytes.
-        @:returns disk size of stored image in bytes
-        """
-        image = Image.open(image_path)
+            logger.debug(f"{dest_image_path}: quality {quality}%, {len(jpeg_bytes)} bytes, {encode_count} encodes")
+            encode_counts.append(encode_count)
+        return encode_counts
 
-        # Start with a high quality value
-        quality = 90
+    def _encode_image(self, image, target_size: int):
+        """Encode an image as JPEG in memory with the highest quality that fits in target_size.
 
-        while True:
-            output_buffer = BytesIO()
-            image.save(output_buffer, format='JPEG', optimize=True, quality=quality)
-            compressed_image_data = output_buffer.getvalue()
+        The quality is searched between self.quality and MAX_SNAPSHOT_QUALITY. Most
+        pages fit at the highest quality, so it's tried first; otherwise the quality
+        is found by bisection. Every encode is kept, so the chosen one is never
+        encoded twice. If no quality fits, the image is encoded at self.quality.
 
-            compressed_image_size = len(compressed_image_data)
-            if compressed_image_size <= target_size or quality < self.quality:
-                with open(image_path, 'wb') as f:
-                    f.write(compressed_image_data)
-                return compressed_image_size
-
-            # Reduce the quality level
-            quality -= 10
+        :param image: PIL image of a page
+        :param target_size (int): The desired target size in bytes.
+        :returns (JPEG bytes, quality, number of encodes)
+        """
+        min_quality = min(self.quality, MAX_SNAPSHOT_QUALITY)
+        encoded = {}  # quality -> JPEG bytes
+
+        def encode(quality: int) -> bytes:
+            if quality not in encoded:
+                output_buffer = BytesIO()
+                image.save(output_buffer, format='JPEG', optimize=True, quality=quality)
+                encoded[quality] = output_buffer.getvalue()
+            return encoded[quality]
+
+        def fits(quality: int) -> bool:
+            return len(encode(quality)) <= target_size
+
+        if fits(MAX_SNAPSHOT_QUALITY):
+            quality = MAX_SNAPSHOT_QUALITY
+        else:
+            quality, _ = bisect_highest_quality(fits, min_quality=min_quality,
+                                                max_quality=MAX_SNAPSHOT_QUALITY - 1)
+            if quality is None:
+                quality = min_quality
+
+        return encode(quality), quality, len(encoded)
 
 
 # # Usage example
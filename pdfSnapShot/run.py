@@ -1,23 +1,33 @@
 import argparse
 from typing import List
 
-from pdfSnapShot.app.pdf_snapshot import PDFSnapshotGenerator
+from pdfSnapShot.app.pdf_snapshot import PDFSnapshotGenerator, SNAPSHOT_DPI, parse_thumbnail_size
 from utility.logger_util.setup_logger import logger
+from utility.pdf_functions import parse_page_ranges
+from utility.rasterizer import DEFAULT_RASTERIZER, RASTERIZER_NAMES
 from utility.user_input_functions import get_clean_user_input_paths, \
     get_clean_user_output_path
 
 
 def generate_snapshots_of_pdf_pages(user_input: List[str], dest_path: str,
-                                    image_quality: int):
+                                    image_quality: int, workers: int = 1, pages: str = '',
+                                    thumbnail: str = '', dpi: int = SNAPSHOT_DPI,
+                                    rasterizer: str = DEFAULT_RASTERIZER):
     """
     Generate JPEG snapshots of each page of the PDF files in the input directories/pdfs.
     :param user_input: (list) A list of user items.
     :param dest_path: (str) The optional destination directory to store generated images
     :param image_quality: (int) Quality percentage of generated images
+    :param workers: (int) Number of processes rendering and encoding pages in parallel
+    :param pages: (str) Pages to snapshot such as '1,3-5,-1', empty for all pages
+    :param thumbnail: (str) Fit the snapshots in this size such as '320x240'
+    :param dpi: (int) Rendering resolution of the pages
+    :param rasterizer: (str) Backend rendering the pages: 'poppler' or 'fitz'
     :return:
     """
     generator = PDFSnapshotGenerator(user_input=user_input, user_dest_path=dest_path,
-                                     quality=image_quality)
+                                     quality=image_quality, workers=workers, pages=pages,
+                                     thumbnail=thumbnail, dpi=dpi, rasterizer=rasterizer)
     generator.generate_pdf_snapshots()  # Generate snapshots from PDF pages
     logger.info("PDF snapshots generation completed.")
 
@@ -36,8 +46,38 @@ def run_app():
                         help="Optional: Enter quality reduction percentage of generated images",
                         default=100)
 
+    parser.add_argument("--workers", type=int,
+                        help="Optional: Number of processes rendering and encoding pages in parallel",
+                        default=1)
+
+    parser.add_argument("--pages", type=str,
+                        help="Optional: Pages to snapshot separated by commas, e.g. '1,3-5,-1' "
+                             "(-1 is the last page). Default=all pages",
+                        default='')
+
+    parser.add_argument("--thumbnail", type=str,
+                        help="Optional: Render the pages to fit in this size, e.g. '320x240', "
+                             "'320x' (width only) or 'x240' (height only). Default=full size",
+                        default='')
+
+    parser.add_argument("--dpi", type=int,
+                        help=f"Optional: Rendering resolution of the pages (ignored with --thumbnail). "
+                             f"Default={SNAPSHOT_DPI}",
+                        default=SNAPSHOT_DPI)
+
+    parser.add_argument("--rasterizer", type=str, choices=RASTERIZER_NAMES,
+                        help=f"Optional: Backend rendering the pages, 'poppler' (pdf2image) or 'fitz' "
+                             f"(PyMuPDF, in-process). Default={DEFAULT_RASTERIZER}",
+                        default=DEFAULT_RASTERIZER)
+
     args = parser.parse_args()
 
+    try:
+        parse_page_ranges(args.pages)
+        parse_thumbnail_size(args.thumbnail)
+    except ValueError as e:
+        parser.error(str(e))
+
     # Clean user-input, don't blindly trust user.
     input_paths = get_clean_user_input_paths(user_input=args.input_paths)  # list of str
     dest_path = get_clean_user_output_path(args.dest_path)  # str
@@ -45,7 +85,9 @@ def run_app():
 
     # Generate the Snapshot of all PDF files
     generate_snapshots_of_pdf_pages(
-        user_input=input_paths, dest_path=dest_path, image_quality=image_quality
+        user_input=input_paths, dest_path=dest_path, image_quality=image_quality,
+        workers=args.workers, pages=args.pages, thumbnail=args.thumbnail, dpi=args.dpi,
+        rasterizer=args.rasterizer
     )
 
 
@@ -0,0 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# How a gray page is turned into black and white pixels:
+#   dither    - PIL's Floyd-Steinberg dithering, keeps the look of photos (noisy on scans)
+#   threshold - pixels darker than a fixed threshold are black, no dithering
+#   otsu      - threshold chosen per page from its histogram (Otsu's method)
+#   sauvola   - threshold per pixel from the mean and deviation around it (Sauvola), for
+#               scans with uneven lighting, stains or colored backgrounds
+BINARIZATION_METHODS = ('dither', 'threshold', 'otsu', 'sauvola')
+DEFAULT_BINARIZATION = 'dither'
+DEFAULT_THRESHOLD = 128
+
+# Sauvola: side of the window around each pixel, in inches (30 pixels at 300 DPI) ...
+SAUVOLA_WINDOW_INCHES = 0.1
+# ... sensitivity to the local contrast, and dynamic range of the standard deviation
+SAUVOLA_K = 0.2
+SAUVOLA_R = 128
+# Rows of a page binarized at once by a thread (each tile also reads half a window above and below)
+TILE_ROWS = 256
+
+
+def binarize(gray_page: Image.Image, method: str = DEFAULT_BINARIZATION, dpi: int = 300,
+             threshold: int = DEFAULT_THRESHOLD, threads: int = 1) -> Image.Image:
+    """
+    Convert a page to black and white.
+
+    Except 'dither', the methods are vectorized with NumPy and 'sauvola' works on
+    tiles of TILE_ROWS rows, binarized in parallel by 'threads' threads (NumPy
+    releases the GIL) with memory bounded by the tile size. Plain thresholds give
+    clean edges and flat white backgrounds, which compress far better than dithered
+    noise.
+
+    :param gray_page: PIL image of the page, converted to 'L' if it isn't
+    :param method: one of BINARIZATION_METHODS
+    :param dpi: resolution of the page, sets the Sauvola window size
+    :param threshold: gray level (0-255) below which pixels are black, for 'threshold'
+    :param threads: number of threads binarizing the tiles, for 'sauvola'
+    :return: PIL image in mode '1'
+    """
+    if method not in BINARIZATION_METHODS:
+        raise ValueError(f"unknown binarization method '{method}', choose from {', '.join(BINARIZATION_METHODS)}")
+
+    if gray_page.mode != 'L':
+        gray_page = gray_page.convert('L')
+
+    if method == 'dither':
+        return gray_page.convert('1')
+
+    gray = np.asarray(gray_page)
+    if method == 'threshold':
+        white = gray >= threshold
+    elif method == 'otsu':
+        white = gray > otsu_threshold(gray)
+    else:
+        white = _sauvola(gray, window=max(3, int(dpi * SAUVOLA_WINDOW_INCHES) | 1), threads=threads)
+
+    return Image.fromarray(white)  # bool array -> mode '1'
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """
+    Return the gray level splitting the pixels in the two classes (ink and paper)
+    with the largest between-class variance (Otsu's method).
+
+    :param gray: 2D uint8 array
+    :return: threshold; pixels above it are white
+    """
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    pixel_count = histogram.sum()
+    # pixels (and sum of their levels) at or below each level
+    class_count = np.cumsum(histogram)
+    class_sum = np.cumsum(histogram * np.arange(256))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between_class_variance = (class_sum[-1] * class_count - class_sum * pixel_count) ** 2 / \
+                                 (class_count * (pixel_count - class_count))
+    between_class_variance[~np.isfinite(between_class_variance)] = 0
+    return int(np.argmax(between_class_variance))
+
+
+def _sauvola(gray: np.ndarray, window: int, threads: int) -> np.ndarray:
+    """
+    Sauvola's threshold, T = mean * (1 + k * (deviation / R - 1)), with the mean and
+    standard deviation of the window around each pixel.
+
+    :param gray: 2D uint8 array
+    :param window: odd side of the window in pixels
+    :param threads: number of threads binarizing the tiles
+    :return: 2D bool array, True for white pixels
+    """
+    white = np.empty(gray.shape, dtype=bool)
+    tile_tops = range(0, gray.shape[0], TILE_ROWS)
+
+    def binarize_tile(top: int):
+        bottom = min(top + TILE_ROWS, gray.shape[0])
+        white[top:bottom] = _sauvola_tile(gray, top, bottom, window)
+
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(binarize_tile, tile_tops))  # list() re-raises errors of the threads
+    else:
+        for top in tile_tops:
+            binarize_tile(top)
+    return white
+
+
+def _sauvola_tile(gray: np.ndarray, top: int, bottom: int, window: int) -> np.ndarray:
+    """
+    Binarize rows [top, bottom) of the page. The window sums are read from integral
+    images (cumulative sums) of the tile and its halo, so the cost doesn't depend
+    on the window size.
+
+    :return: 2D bool array of the rows, True for white pixels
+    """
+    half = window // 2
+    halo_top, halo_bottom = max(0, top - half), min(gray.shape[0], bottom + half)
+    # outside of the page, repeat the border pixels
+    tile = np.pad(gray[halo_top:halo_bottom],
+                  ((half - (top - halo_top), half - (halo_bottom - bottom)), (half, half)),
+                  mode='edge').astype(np.float64)
+
+    area = window * window
+    mean = _window_sums(tile, window) / area
+    variance = _window_sums(tile * tile, window) / area - mean * mean
+    deviation = np.sqrt(np.maximum(variance, 0))
+
+    local_threshold = mean * (1 + SAUVOLA_K * (deviation / SAUVOLA_R - 1))
+    return gray[top:bottom] > local_threshold
+
+
+def _window_sums(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum of every window x window block of a 2D array (output shrinks by window - 1)"""
+    integral = np.zeros((values.shape[0] + 1, values.shape[1] + 1))
+    np.cumsum(values, axis=0, out=integral[1:, 1:])
+    np.cumsum(integral[1:, 1:], axis=1, out=integral[1:, 1:])
+    return integral[window:, window:] - integral[:-window, window:] - integral[window:, :-window] + \
+        integral[:-window, :-window]
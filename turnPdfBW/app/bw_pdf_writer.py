@@ -0,0 +1,124 @@
+import zlib
+from io import BytesIO
+
+import fitz
+from PIL import Image, features
+
+# TIFF tags read back from the Group 4 TIFF written by Pillow
+TIFF_PHOTOMETRIC = 262
+TIFF_STRIP_OFFSETS = 273
+TIFF_ROWS_PER_STRIP = 278
+TIFF_STRIP_BYTE_COUNTS = 279
+TIFF_MIN_IS_BLACK = 1
+# A Group 4 page smaller than this fraction of its raw bits is kept without trying Deflate
+CCITT_GOOD_ENOUGH_RATIO = 0.1
+
+
+class BWPdfWriter:
+    """
+    Writes black-and-white (1-bit) pages into a PDF with PyMuPDF.
+
+    Each page is a single image stream compressed with CCITT Group 4, the fax
+    compression made for bi-level scans, which PDF readers decode natively. Pillow's
+    PDF writer stores 1-bit pages as hex encoded bitmaps in older versions, which
+    makes files many times larger and slower to write.
+
+    Group 4 codes runs of pixels, so it does badly on dithered photos (a run changes
+    every pixel or two): there, the deflated bits are several times smaller. So when
+    Group 4 doesn't shrink a page well, the bits are deflated too and the smaller one
+    is kept. If Pillow is built without libtiff (no Group 4 encoder), pages are
+    always deflated.
+
+    Pages are sized from the rendering resolution, so the B&W PDF has the same
+    page size as the source PDF.
+
+    How To Use:
+    -----------
+        with BWPdfWriter() as writer:
+            for bw_page in bw_pages:
+                writer.add_page(bw_page, dpi=300)
+            writer.save(bw_pdf_file_path)
+    """
+    def __init__(self):
+        self.pdf_document = fitz.open()
+        self.use_ccitt = features.check_codec('libtiff')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def page_count(self) -> int:
+        return self.pdf_document.page_count
+
+    def add_page(self, bw_image: Image.Image, dpi: int):
+        """
+        Append a page showing a 1-bit image.
+
+        :param bw_image: PIL image, converted to mode '1' if it isn't
+        :param dpi: resolution the page was rendered at
+        """
+        if bw_image.mode != '1':
+            bw_image = bw_image.convert('1')
+
+        width, height = bw_image.size
+        page = self.pdf_document.new_page(width=width * 72 / dpi, height=height * 72 / dpi)
+
+        raw_size = (width + 7) // 8 * height  # bytes of the packed rows of bits
+        encoded_image = self._encode_ccitt_g4(bw_image) if self.use_ccitt else None
+        if encoded_image is None or len(encoded_image[0]) > raw_size * CCITT_GOOD_ENOUGH_RATIO:
+            # packed rows of bits, 1 is white like in DeviceGray
+            deflated_bits = zlib.compress(bw_image.tobytes())
+            if encoded_image is None or len(deflated_bits) < len(encoded_image[0]):
+                encoded_image = deflated_bits, '/FlateDecode', None
+        image_stream, image_filter, decode_parms = encoded_image
+
+        xref = self.pdf_document.get_new_xref()
+        self.pdf_document.update_object(xref, '<<>>')
+        self.pdf_document.update_stream(xref, image_stream, new=True, compress=False)  # already compressed
+        image_keys = {
+            'Type': '/XObject', 'Subtype': '/Image', 'Width': str(width), 'Height': str(height),
+            'ColorSpace': '/DeviceGray', 'BitsPerComponent': '1', 'Filter': image_filter,
+        }
+        if decode_parms:
+            image_keys['DecodeParms'] = decode_parms
+        for key, value in image_keys.items():
+            self.pdf_document.xref_set_key(xref, key, value)
+
+        page.insert_image(page.rect, xref=xref)
+
+    @staticmethod
+    def _encode_ccitt_g4(bw_image: Image.Image):
+        """
+        Encode a 1-bit image with CCITT Group 4 (through Pillow's libtiff TIFF writer).
+
+        :return: (encoded bytes, PDF filter, PDF DecodeParms) or None if the TIFF
+            couldn't be written as a single strip (the stream of a PDF image is one strip)
+        """
+        width, height = bw_image.size
+        tiff_buffer = BytesIO()
+        bw_image.save(tiff_buffer, 'TIFF', compression='group4', tiffinfo={TIFF_ROWS_PER_STRIP: height})
+        tiff_bytes = tiff_buffer.getvalue()
+
+        with Image.open(BytesIO(tiff_bytes)) as tiff_image:
+            strip_offsets = tiff_image.tag_v2.get(TIFF_STRIP_OFFSETS)
+            strip_byte_counts = tiff_image.tag_v2.get(TIFF_STRIP_BYTE_COUNTS)
+            photometric = tiff_image.tag_v2.get(TIFF_PHOTOMETRIC)
+        if not strip_offsets or len(strip_offsets) != 1:
+            return None
+
+        g4_bytes = tiff_bytes[strip_offsets[0]:strip_offsets[0] + strip_byte_counts[0]]
+        # the fax coder works on the raw bits: with Pillow's black=0 ('min-is-black'), the
+        # 1 bits are the white pixels, so the decoder must output the coded 'black' runs as 1
+        black_is_1 = 'true' if photometric == TIFF_MIN_IS_BLACK else 'false'
+        decode_parms = f'<< /K -1 /Columns {width} /Rows {height} /BlackIs1 {black_is_1} >>'
+        return g4_bytes, '/CCITTFaxDecode', decode_parms
+
+    def save(self, pdf_file_path: str):
+        """Write the PDF; the image streams are already compressed, only the rest is deflated"""
+        self.pdf_document.save(pdf_file_path, garbage=1, deflate=True)
+
+    def close(self):
+        self.pdf_document.close()
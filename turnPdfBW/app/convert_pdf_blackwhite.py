@@ -1,10 +1,18 @@
 import os
-from pdf2image import convert_from_path
+import time
 from typing import List
 from utility.logger_util.setup_logger import logger
 from utility import pdf_functions
 from utility import file_functions
-from pdf2image.exceptions import PDFPageCountError
+from utility.batch_scheduler import BatchJob, BatchScheduler
+from utility.rasterizer import DEFAULT_RASTERIZER, RasterizerError, get_rasterizer
+from turnPdfBW.app.bw_pdf_writer import BWPdfWriter
+from turnPdfBW.app.binarization import DEFAULT_BINARIZATION, DEFAULT_THRESHOLD, binarize
+from turnPdfBW.app.dpi_selector import select_page_dpis
+
+# Consecutive pages of the same resolution rendered by one rasterizer call (one pdftoppm
+# process with poppler). Only this many rendered pages of a PDF are in memory at a time.
+RENDER_BATCH_PAGES = 4
 
 
 class PDFBlackWhiteConverter:
@@ -12,18 +20,41 @@ class PDFBlackWhiteConverter:
     A class to convert any PDF file into a black-and-white (1-bit) PDF.
     """
 
-    def __init__(self, user_input: List[str], pdf_quality: int, user_dest_path: str = ''):
+    def __init__(self, user_input: List[str], pdf_quality: int, user_dest_path: str = '',
+                 rasterizer: str = DEFAULT_RASTERIZER, binarization: str = DEFAULT_BINARIZATION,
+                 threshold: int = DEFAULT_THRESHOLD, threads: int = 1, auto_dpi: bool = True,
+                 workers: int = 1, max_inflight_pages: int = 0):
         """
         :param user_input (list): A list of input directories/PDFs where the PDF files are located.
         :param user_dest_path (str): User specified optional destination directory to store generated images
         :param pdf_quality: (int) Quality percentage of generated B&W PDFs
+        :param rasterizer: (str) Backend rendering the pages: 'poppler' (pdf2image) or 'fitz' (PyMuPDF)
+        :param binarization: (str) How pages are turned black and white: 'dither', 'threshold', 'otsu' or 'sauvola'
+        :param threshold: (int) Gray level (0-255) below which pixels are black, for 'threshold'
+        :param threads: (int) Number of threads binarizing the tiles of a page, for 'sauvola'
+        :param auto_dpi: (bool) Render scanned pages at the resolution of their image (the quality
+            still being the upper bound) instead of always at the resolution of the quality
+        :param workers: (int) Number of PDFs converted at the same time (processes).
+        :param max_inflight_pages: (int) With workers > 1, upper bound on the pages of the PDFs
+            converted at the same time (0: no bound).
         """
         self.user_input = user_input
         self.user_dest_path: str = user_dest_path
         self.pdf_quality = int(pdf_quality)
+        self.rasterizer = get_rasterizer(rasterizer)
+        self.binarization = binarization
+        self.threshold = int(threshold)
+        self.threads = max(1, int(threads))
+        self.auto_dpi = auto_dpi
+        self.workers = max(1, int(workers))
+        self.max_inflight_pages = int(max_inflight_pages)
 
     def convert_all_pdfs_to_BW(self):
         """Iterate over each input directory/PDFs and generate equivalent Black and White PDF files"""
+        if self.workers > 1:
+            self._process_batch()
+            return
+
         for input_path in self.user_input:
             input_path = input_path.strip()
             if not os.path.exists(input_path):
@@ -72,33 +103,154 @@ class PDFBlackWhiteConverter:
             logger.error(f"ERROR: PDF {pdf_file_path} does not exist")
             return ''
 
-        # Convert PDF pages to images
+        # Pages are rendered in batches of RENDER_BATCH_PAGES, then thresholded and written one
+        # at a time, so memory holds a few pages (plus the compressed pages already written)
+        # whatever the length of the PDF
         try:
             pdf_quality = self.quality_to_dpi()
-            pdf_pages = convert_from_path(pdf_file_path, dpi=pdf_quality)
-        except PDFPageCountError:
+            page_count = self.rasterizer.get_pdf_info(pdf_file_path).page_count
+        except RasterizerError:
             logger.error(f"Skipping encrypted or unreadable PDF: {pdf_file_path}")
             return ''
 
-        bw_pages = []
+        if not page_count:
+            logger.error(f"Skipping PDF without pages: {pdf_file_path}")
+            return ''
 
-        for page in pdf_pages:
-            # Convert each page to black and white (1-bit pixels)
-            bw_page = page.convert("1")
-            bw_pages.append(bw_page)
+        page_dpis = self._select_page_dpis(pdf_file_path, page_count, max_dpi=pdf_quality)
 
         # Decide where you want to save the newly generated BW PDF
         bw_pdf_file_path, bw_pdf_dir_path = self.get_unique_path_for_BW_pdf(pdf_file_path)
 
         # create the destination directory for the BW PDF
         file_functions.create_directory(bw_pdf_dir_path)
+        # take the name at once: the other processes of a batch may write in the same directory
+        bw_pdf_file_path = self._reserve_file_path(bw_pdf_file_path)
 
-        # Save all pages as a single PDF
-        bw_pages[0].save(bw_pdf_file_path, save_all=True, append_images=bw_pages[1:])
+        # Save all pages as a single PDF, each page a CCITT Group 4 compressed image
+        saved = False
+        try:
+            with BWPdfWriter() as bw_pdf_writer:
+                for first_page, last_page, page_dpi in self._plan_render_batches(page_dpis):
+                    # grayscale: 1/3 of the memory of RGB, and "1" is thresholded from gray anyway
+                    pages = self.rasterizer.convert(pdf_file_path, dpi=page_dpi, first_page=first_page,
+                                                    last_page=last_page, grayscale=True)
+                    while pages:
+                        page = pages.pop(0)  # free each rendered page once it is written
+                        bw_pdf_writer.add_page(self._convert_page_to_bw(page, dpi=page_dpi), dpi=page_dpi)
+                        del page
+
+                bw_pdf_writer.save(bw_pdf_file_path)
+            saved = True
+        except RasterizerError:
+            logger.error(f"Skipping encrypted or unreadable PDF: {pdf_file_path}")
+            return ''
+        finally:
+            if not saved:  # don't leave the reserved (empty or partly written) file behind
+                os.remove(bw_pdf_file_path)
 
         print(f"Black & white PDF saved in directory: {bw_pdf_dir_path}")
         return bw_pdf_file_path
 
+    @staticmethod
+    def _reserve_file_path(file_path: str) -> str:
+        """Create an empty file at a unique path close to file_path and return that path"""
+        while True:
+            file_path = file_functions.get_unique_filepath_in_same_dir(file_path)
+            try:
+                open(file_path, 'x').close()  # fails if another process created it since
+                return file_path
+            except FileExistsError:
+                continue
+
+    @staticmethod
+    def _plan_render_batches(page_dpis: List[int]) -> list:
+        """
+        :param page_dpis: rendering resolution of each page
+        :return: list of (first page, last page, resolution): at most RENDER_BATCH_PAGES
+            consecutive pages of the same resolution, 1-based and inclusive
+        """
+        batches = []  # [first page, last page, resolution]
+        for page_number, page_dpi in enumerate(page_dpis, start=1):
+            if batches and batches[-1][2] == page_dpi and page_number - batches[-1][0] < RENDER_BATCH_PAGES:
+                batches[-1][1] = page_number
+            else:
+                batches.append([page_number, page_number, page_dpi])
+        return [tuple(batch) for batch in batches]
+
+    def _select_page_dpis(self, pdf_file_path: str, page_count: int, max_dpi: int) -> List[int]:
+        """
+        :param max_dpi: resolution of the quality setting
+        :return: rendering resolution of each page
+        """
+        page_dpis = select_page_dpis(pdf_file_path, max_dpi) if self.auto_dpi else []
+        if len(page_dpis) != page_count:  # not analysed, or the rasterizer counts pages differently
+            return [max_dpi] * page_count
+
+        if min(page_dpis) < max_dpi:
+            logger.info(f"{pdf_file_path}: scanned pages rendered at their own resolution: "
+                        f"{sum(dpi < max_dpi for dpi in page_dpis)} of {page_count} pages below {max_dpi} DPI")
+        return page_dpis
+
+    def _convert_page_to_bw(self, page, dpi: int):
+        """Convert a rendered page to black and white (1-bit pixels)"""
+        return binarize(page, method=self.binarization, dpi=dpi, threshold=self.threshold, threads=self.threads)
+
+    def _process_batch(self):
+        """
+        Convert all PDFs of all input paths with a pool of 'workers' processes.
+
+        The complete list of PDFs is built first (one directory walk), password
+        protected PDFs are skipped right away, and the scheduler starts the largest
+        files first and keeps the pages converted at the same time under
+        'max_inflight_pages'. A summary of the time taken by each file is logged at
+        the end.
+        """
+        jobs, skipped_pdf_paths = [], []
+        for pdf_file_path in pdf_functions.plan_pdf_files(self.user_input):
+            if pdf_functions.needs_password(pdf_file_path):
+                logger.error(f"Skipping encrypted or unreadable PDF: {pdf_file_path}")
+                skipped_pdf_paths.append(pdf_file_path)
+                continue
+            jobs.append(BatchJob(path=pdf_file_path,
+                                 size_in_bytes=file_functions.get_file_size_in_bytes(pdf_file_path),
+                                 cost=max(1, pdf_functions.get_page_count(pdf_file_path))))
+        logger.info(f"Converting {len(jobs)} PDFs with {self.workers} processes")
+
+        start_time = time.perf_counter()
+        batch_results = []
+        scheduler = BatchScheduler(workers=self.workers, max_inflight_cost=self.max_inflight_pages)
+        for batch_result in scheduler.run(self.convert_pdf_to_bw, jobs):
+            batch_results.append(batch_result)
+            if batch_result.result:
+                logger.info(f"SUCCESS: {batch_result.job.path} ({batch_result.job.cost} pages) processed in "
+                            f"{batch_result.elapsed_seconds:.1f} seconds.\n")
+            elif not batch_result.error:  # reported by convert_pdf_to_bw
+                skipped_pdf_paths.append(batch_result.job.path)
+
+        self._log_batch_summary(batch_results, skipped_pdf_paths, time.perf_counter() - start_time)
+
+    @staticmethod
+    def _log_batch_summary(batch_results: list, skipped_pdf_paths: List[str], wall_seconds: float):
+        """
+        :param batch_results: BatchResult of every converted or failed PDF
+        :param skipped_pdf_paths: encrypted, unreadable or empty PDFs
+        :param wall_seconds: duration of the batch
+        """
+        converted = [batch_result for batch_result in batch_results if batch_result.result]
+        failed = [batch_result for batch_result in batch_results if batch_result.error]
+        converted_pages = sum(batch_result.job.cost for batch_result in converted)
+
+        summary = [f"Batch summary: {len(converted)} converted, {len(skipped_pdf_paths)} skipped, "
+                   f"{len(failed)} failed in {wall_seconds:.1f} seconds "
+                   f"({converted_pages / wall_seconds if wall_seconds else 0:.1f} pages/second)"]
+        summary += [f"    {batch_result.elapsed_seconds:8.1f} s  {batch_result.job.cost:6} pages  "
+                    f"{batch_result.job.path}"
+                    for batch_result in sorted(converted, key=lambda result: result.elapsed_seconds, reverse=True)]
+        summary += [f"    skipped: {pdf_file_path}" for pdf_file_path in skipped_pdf_paths]
+        summary += [f"    failed:  {batch_result.job.path}: {batch_result.error}" for batch_result in failed]
+        logger.info('\n'.join(summary) + '\n')
+
     def _process_pdfs_files(self, pdf_file_paths: List[str]):
         """Process each PDF file to generate compressed PDF within specified target size in MB.
         :param pdf_file_paths (list <str>): A list of paths to the PDF files to process.
@@ -0,0 +1,56 @@
+import math
+from typing import List
+
+import fitz
+
+from utility.logger_util.setup_logger import logger
+
+# A page is a scan when one image covers at least this fraction of it
+SCAN_COVERAGE = 0.9
+# Scans are never rendered below this resolution: a little oversampling of the gray
+# image keeps the edges of the black-and-white pixels smooth
+MIN_SCAN_DPI = 150
+
+
+def select_page_dpis(pdf_path: str, max_dpi: int) -> List[int]:
+    """
+    Choose the rendering resolution of each page from what it contains.
+
+    A scanned page (one image covering most of the page) has no more detail than
+    its image: rendering it above the resolution of the image only interpolates
+    pixels, so it is rendered at the image's resolution. Text and vector graphics
+    have no resolution of their own, so any other page is rendered at max_dpi.
+    Every page stays within [MIN_SCAN_DPI, max_dpi].
+
+    :param pdf_path: path of the PDF
+    :param max_dpi: resolution given by the quality setting, upper bound of every page
+    :return: resolution of each page, empty list if the PDF can't be analysed
+    """
+    try:
+        with fitz.open(pdf_path) as pdf_document:
+            return [_select_page_dpi(page, max_dpi) for page in pdf_document]
+    except Exception as e:  # damaged PDF: the rasterizer reports it, don't fail here
+        logger.debug(f"select_page_dpis: cannot analyse {pdf_path}: {e}")
+        return []
+
+
+def _select_page_dpi(page, max_dpi: int) -> int:
+    """:return: resolution of a fitz page, see select_page_dpis"""
+    page_area = abs(page.rect)
+    if not page_area:
+        return max_dpi
+
+    scan_dpi = 0
+    for image_info in page.get_image_info():
+        image_rect = fitz.Rect(image_info['bbox'])
+        if image_rect.is_empty or abs(image_rect & page.rect) < SCAN_COVERAGE * page_area:
+            continue
+
+        # resolution of the image as shown on the page, the finer direction decides
+        image_dpi = max(image_info['width'] / (image_rect.width / 72),
+                        image_info['height'] / (image_rect.height / 72))
+        scan_dpi = max(scan_dpi, image_dpi)
+
+    if not scan_dpi:
+        return max_dpi
+    return min(max_dpi, max(MIN_SCAN_DPI, math.ceil(scan_dpi)))
@@ -6,6 +6,8 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from turnPdfBW.app.convert_pdf_blackwhite import PDFBlackWhiteConverter
 from utility.user_input_functions import get_clean_user_input_paths, \
     get_clean_user_output_path
+from utility.rasterizer import DEFAULT_RASTERIZER, RASTERIZER_NAMES
+from turnPdfBW.app.binarization import BINARIZATION_METHODS, DEFAULT_BINARIZATION, DEFAULT_THRESHOLD
 
 
 def run_app():
@@ -22,6 +24,41 @@ def run_app():
                         help="Optional: Enter quality of generated B&W PDFs in terms of percentage (max: 100)",
                         default=60)
 
+    parser.add_argument("--rasterizer", type=str, choices=RASTERIZER_NAMES,
+                        help=f"Optional: Backend rendering the pages, 'poppler' (pdf2image) or 'fitz' "
+                             f"(PyMuPDF, in-process). Default={DEFAULT_RASTERIZER}",
+                        default=DEFAULT_RASTERIZER)
+
+    parser.add_argument("--binarization", type=str, choices=BINARIZATION_METHODS,
+                        help="Optional: How pages are turned black and white: 'dither' (keeps photos), "
+                             "'threshold' (fixed gray level), 'otsu' (gray level chosen per page) or 'sauvola' "
+                             f"(adaptive, for scans). Default={DEFAULT_BINARIZATION}",
+                        default=DEFAULT_BINARIZATION)
+
+    parser.add_argument("--threshold", type=int,
+                        help="Optional: Gray level (0-255) below which pixels are black with "
+                             f"'--binarization threshold'. Default={DEFAULT_THRESHOLD}",
+                        default=DEFAULT_THRESHOLD)
+
+    parser.add_argument("--threads", type=int,
+                        help="Optional: Number of threads binarizing the tiles of a page with "
+                             "'--binarization sauvola'. Default=1",
+                        default=1)
+
+    parser.add_argument("--fixed-dpi", action="store_true",
+                        help="Optional: Render every page at the resolution of --quality, even scanned pages "
+                             "whose image has a lower resolution")
+
+    parser.add_argument("--workers", type=int,
+                        help="Optional: Number of PDFs converted at the same time (processes, largest first). "
+                             "Default=1",
+                        default=1)
+
+    parser.add_argument("--max-inflight-pages", type=int,
+                        help="Optional: With --workers, upper bound on the pages of PDFs converted at the same "
+                             "time. Default=0 (no bound)",
+                        default=0)
+
     args = parser.parse_args()
 
     # Clean user-input, don't blindly trust user.
@@ -31,7 +68,10 @@ def run_app():
 
     # Convert PDFs into high-quality black-and-white versions while preserving original files.
     PDFBlackWhiteConverter(
-        user_input=input_paths, user_dest_path=dest_path, pdf_quality=pdf_quality
+        user_input=input_paths, user_dest_path=dest_path, pdf_quality=pdf_quality,
+        rasterizer=args.rasterizer, binarization=args.binarization, threshold=args.threshold,
+        threads=args.threads, auto_dpi=not args.fixed_dpi, workers=args.workers,
+        max_inflight_pages=args.max_inflight_pages
     ).convert_all_pdfs_to_BW()
 
 if __name__ == "__main__":
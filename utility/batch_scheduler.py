@@ -0,0 +1,87 @@
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Iterator, List, NamedTuple
+
+from utility.logger_util.setup_logger import logger
+
+
+class BatchJob(NamedTuple):
+    """One file of a batch"""
+    path: str
+    size_in_bytes: int
+    cost: int = 1  # units counted against 'max_inflight_cost', e.g. pages of a PDF
+
+
+class BatchResult(NamedTuple):
+    """Outcome of one file of a batch"""
+    job: BatchJob
+    result: object  # whatever the task returned, None if it failed
+    error: str  # empty if the task succeeded
+    elapsed_seconds: float
+
+
+class BatchScheduler:
+    """
+    Run a task on many files with a pool of worker processes.
+
+    Jobs are dispatched largest-first: a big file started at the end of a batch
+    would otherwise keep one core busy long after all others are done. The sum of
+    the cost of jobs running at the same time (for example pages being rendered)
+    is kept under 'max_inflight_cost' to bound memory. Results are yielded as soon
+    as each file completes, and a file that fails does not stop the batch.
+
+    How To Use:
+    -----------
+        jobs = [BatchJob(path, os.path.getsize(path), page_count) for path in paths]
+        for batch_result in BatchScheduler(workers=8, max_inflight_cost=2000).run(task, jobs):
+            ...
+    """
+    def __init__(self, workers: int = os.cpu_count(), max_inflight_cost: int = 0):
+        """
+        :param workers: (int) Number of worker processes.
+        :param max_inflight_cost: (int) Upper bound on the cost of jobs running at the same
+            time; 0 means no bound. A job costing more than the bound runs alone.
+        """
+        self.workers = max(1, workers or 1)
+        self.max_inflight_cost = max_inflight_cost
+
+    def run(self, task: Callable[[str], object], jobs: List[BatchJob]) -> Iterator[BatchResult]:
+        """
+        :param task: picklable callable(path) run in a worker process for each job
+        :param jobs: files to process
+        :return: generator of BatchResult in the order the jobs complete
+        """
+        pending_jobs = sorted(jobs, key=lambda job: job.size_in_bytes, reverse=True)
+        running = {}  # future -> (job, start time)
+        inflight_cost = 0
+
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while pending_jobs or running:
+                # keep largest-first order: stop at the first job which doesn't fit
+                while pending_jobs and len(running) < self.workers and \
+                        self._can_start(pending_jobs[0], inflight_cost, bool(running)):
+                    job = pending_jobs.pop(0)
+                    running[executor.submit(task, job.path)] = (job, time.perf_counter())
+                    inflight_cost += job.cost
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, start_time = running.pop(future)
+                    inflight_cost -= job.cost
+                    elapsed_seconds = time.perf_counter() - start_time
+
+                    try:
+                        batch_result = BatchResult(job, future.result(), '', elapsed_seconds)
+                    except Exception as e:
+                        logger.error(f"ERROR: {job.path} failed: {e}")
+                        logger.debug(traceback.format_exc())
+                        batch_result = BatchResult(job, None, str(e) or type(e).__name__, elapsed_seconds)
+                    yield batch_result
+
+    def _can_start(self, job: BatchJob, inflight_cost: int, has_running_jobs: bool) -> bool:
+        """Return True if the job fits next to the jobs already running"""
+        if not self.max_inflight_cost or not has_running_jobs:
+            return True
+        return inflight_cost + job.cost <= self.max_inflight_cost
@@ -56,6 +56,52 @@ def list_directories(directory: str) -> list:
         return []
 
 
+def plan_files(input_paths: list, file_extensions: list) -> list:
+    """Collect the unique files of the user input having one of the extensions, in a single pass.
+
+    Each input is either a file or a directory searched recursively with one
+    os.scandir walk; every directory is visited once (symlink loops included)
+    and a file reachable through several inputs is returned once.
+    @:param input_paths: files and directories given by the user
+    @:param file_extensions: <list of str> extensions to keep such as ['.pdf'], case-insensitive
+    @:returns: sorted list of absolute paths of the files to process
+    """
+    file_extensions = tuple(extension.lower() for extension in file_extensions)
+    file_paths = set()
+    visited_directories = set()
+
+    for input_path in input_paths:
+        input_path = input_path.strip()
+        if not os.path.exists(input_path):
+            logger.error(f"ERROR: input path {input_path} does not exist.\n")
+            continue
+
+        if os.path.isfile(input_path):
+            if input_path.lower().endswith(file_extensions):
+                file_paths.add(os.path.realpath(input_path))
+            continue
+
+        directories = [input_path]
+        while directories:
+            directory = directories.pop()
+            real_directory = os.path.realpath(directory)
+            if real_directory in visited_directories:
+                continue
+            visited_directories.add(real_directory)
+
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            directories.append(entry.path)
+                        elif entry.is_file() and entry.name.lower().endswith(file_extensions):
+                            file_paths.add(os.path.realpath(entry.path))
+            except OSError as e:
+                logger.error(f"ERROR: cannot list directory {directory}: {e}")
+
+    return sorted(file_paths)
+
+
 def is_directory(path: str) -> bool:
     """
     :param path: absolute path
@@ -32,3 +32,13 @@ def is_image_file(file_path: str) -> bool:
         return False
 
     return file_extension.lower() in global_image_extensions
+
+
+def plan_image_files(input_paths: list) -> list:
+    """Collect the unique image files of the user input (images and directories searched
+    recursively) in a single pass.
+
+    :param input_paths: images and directories given by the user
+    :return: sorted list of absolute paths of the images to process
+    """
+    return file_functions.plan_files(input_paths, file_extensions=list(global_image_extensions))
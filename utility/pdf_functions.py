@@ -1,5 +1,8 @@
 import os
+import re
+from typing import List, Tuple
 from utility import file_functions
+from utility.logger_util.setup_logger import logger
 
 
 def is_pdf_or_directory(file_path: str) -> bool:
@@ -26,4 +29,79 @@ def find_pdf_files(directory: str) -> list:
         for file in files:
             if file.endswith('.pdf'):
                 pdf_file_paths.append(os.path.join(root, file))
-    return pdf_file_paths
\ No newline at end of file
+    return pdf_file_paths
+
+
+def plan_pdf_files(input_paths: List[str]) -> List[str]:
+    """Collect the unique PDF files of the user input, see file_functions.plan_files"""
+    return file_functions.plan_files(input_paths, file_extensions=['.pdf'])
+
+
+def parse_page_ranges(pages: str) -> List[Tuple[int, int]]:
+    """Parse a page selection such as '1,3-5,-1'.
+
+    Pages are 1-based; negative numbers count from the last page (-1 is the last
+    page), so '2--1' is every page but the first one.
+    @:param pages: comma separated page numbers and ranges
+    @:returns: list of (first page, last page), not yet resolved against a page count
+    @:raises ValueError: for a malformed selection
+    """
+    page_ranges = []
+    for token in pages.split(','):
+        token = token.strip()
+        if not token:
+            continue
+
+        match = re.fullmatch(r'(-?\d+)(?:-(-?\d+))?', token)
+        if not match:
+            raise ValueError(f"invalid page selection '{token}', expected e.g. '1,3-5,-1'")
+
+        first_page = int(match.group(1))
+        last_page = int(match.group(2)) if match.group(2) else first_page
+        if first_page == 0 or last_page == 0:
+            raise ValueError(f"invalid page selection '{token}', pages start at 1")
+        page_ranges.append((first_page, last_page))
+    return page_ranges
+
+
+def select_pages(page_ranges: List[Tuple[int, int]], page_count: int) -> List[int]:
+    """Resolve the ranges of parse_page_ranges against the page count of a PDF.
+    Pages outside the PDF are ignored.
+    @:returns: sorted list of unique 1-based page numbers
+    """
+    selected_pages = set()
+    for first_page, last_page in page_ranges:
+        first_page = first_page if first_page > 0 else page_count + 1 + first_page
+        last_page = last_page if last_page > 0 else page_count + 1 + last_page
+        selected_pages.update(range(max(first_page, 1), min(last_page, page_count) + 1))
+    return sorted(selected_pages)
+
+
+def get_page_count(pdf_path: str) -> int:
+    """Return the number of pages of a PDF, or 0 if it can't be opened (damaged/encrypted).
+    @:param pdf_path: absolute path
+    @:returns: int
+    """
+    import fitz  # PyMuPDF; imported here so tools not using this function don't need it
+
+    try:
+        with fitz.open(pdf_path) as pdf_document:
+            return pdf_document.page_count
+    except Exception as e:
+        logger.error(f"get_page_count: cannot open {pdf_path}: {e}")
+        return 0
+
+
+def needs_password(pdf_path: str) -> bool:
+    """Return True if the PDF can't be opened without a password (or can't be opened at all).
+    @:param pdf_path: absolute path
+    @:returns: bool
+    """
+    import fitz  # PyMuPDF; imported here so tools not using this function don't need it
+
+    try:
+        with fitz.open(pdf_path) as pdf_document:
+            return bool(pdf_document.needs_pass)
+    except Exception as e:
+        logger.error(f"needs_password: cannot open {pdf_path}: {e}")
+        return True
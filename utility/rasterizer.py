@@ -0,0 +1,169 @@
+from abc import ABC, abstractmethod
+from typing import List, NamedTuple, Optional, Union
+
+from PIL import Image
+
+# Backends converting PDF pages to images, selected by name with get_rasterizer
+#   poppler - pdf2image: runs pdftoppm in a subprocess, pages go through temporary PPM files
+#   fitz    - PyMuPDF: renders the pages in this process, straight into memory
+RASTERIZER_NAMES = ('poppler', 'fitz')
+DEFAULT_RASTERIZER = 'poppler'
+
+
+class RasterizerError(Exception):
+    """The PDF cannot be rasterized: encrypted, damaged or not a PDF"""
+
+
+class PdfInfo(NamedTuple):
+    """What the tools need to know about a PDF before rasterizing it"""
+    page_count: int
+    page_width: float  # size of the first page in points (1/72 inch), rotation applied
+    page_height: float
+
+
+class Rasterizer(ABC):
+    """
+    Converts PDF pages to PIL images. Both backends take the same arguments as
+    pdf2image.convert_from_path and return the same images, so the tools can use
+    either one.
+
+    How To Use:
+    -----------
+        rasterizer = get_rasterizer('fitz')
+        page_count = rasterizer.get_pdf_info(pdf_path).page_count
+        images = rasterizer.convert(pdf_path, dpi=150, first_page=1, last_page=4)
+    """
+    name = ''
+
+    @abstractmethod
+    def get_pdf_info(self, pdf_path: str) -> PdfInfo:
+        """
+        :param pdf_path: path of the PDF
+        :raises RasterizerError: if the PDF cannot be read
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def convert(self, pdf_path: str, dpi: int = 200, first_page: int = None, last_page: int = None,
+                size: Union[tuple, int] = None, grayscale: bool = False) -> List[Image.Image]:
+        """
+        :param pdf_path: path of the PDF
+        :param dpi: rendering resolution, ignored when size is given
+        :param first_page: first page to convert (1-based), default: first page of the PDF
+        :param last_page: last page to convert (inclusive), default: last page of the PDF
+        :param size: (width, height) of the images, a None side follows the aspect ratio of the page;
+            an int is the size of the longest side
+        :param grayscale: return 'L' images instead of 'RGB' ones
+        :return: list of PIL images in page order
+        :raises RasterizerError: if the PDF cannot be read
+        """
+        raise NotImplementedError
+
+
+class PopplerRasterizer(Rasterizer):
+    """Rasterizer running poppler's pdftoppm through pdf2image"""
+    name = 'poppler'
+
+    def get_pdf_info(self, pdf_path: str) -> PdfInfo:
+        import pdf2image
+        from pdf2image.exceptions import PDFPageCountError, PDFSyntaxError
+
+        try:
+            pdf_info = pdf2image.pdfinfo_from_path(pdf_path)
+        except (PDFPageCountError, PDFSyntaxError) as e:
+            raise RasterizerError(f"cannot read {pdf_path}: {e}") from e
+
+        # e.g. 'Page size': '612 x 792 pts (letter)'
+        page_size = str(pdf_info.get('Page size', '0 x 0')).split()
+        try:
+            page_width, page_height = float(page_size[0]), float(page_size[2])
+        except (IndexError, ValueError):
+            page_width, page_height = 0.0, 0.0
+        if int(pdf_info.get('Page rot', 0) or 0) % 180:
+            page_width, page_height = page_height, page_width
+
+        return PdfInfo(int(pdf_info['Pages']), page_width, page_height)
+
+    def convert(self, pdf_path: str, dpi: int = 200, first_page: int = None, last_page: int = None,
+                size: Union[tuple, int] = None, grayscale: bool = False) -> List[Image.Image]:
+        import pdf2image
+        from pdf2image.exceptions import PDFPageCountError, PDFSyntaxError
+
+        try:
+            return pdf2image.convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page,
+                                               size=size, grayscale=grayscale)
+        except (PDFPageCountError, PDFSyntaxError) as e:
+            raise RasterizerError(f"cannot read {pdf_path}: {e}") from e
+
+
+class FitzRasterizer(Rasterizer):
+    """Rasterizer rendering the pages in-process with PyMuPDF, without temporary files"""
+    name = 'fitz'
+
+    def get_pdf_info(self, pdf_path: str) -> PdfInfo:
+        with self._open(pdf_path) as pdf_document:
+            if not pdf_document.page_count:
+                return PdfInfo(0, 0.0, 0.0)
+            page_rect = pdf_document[0].rect  # rotation applied
+            return PdfInfo(pdf_document.page_count, page_rect.width, page_rect.height)
+
+    def convert(self, pdf_path: str, dpi: int = 200, first_page: int = None, last_page: int = None,
+                size: Union[tuple, int] = None, grayscale: bool = False) -> List[Image.Image]:
+        import fitz
+
+        images = []
+        with self._open(pdf_path) as pdf_document:
+            first_page = max(first_page or 1, 1)
+            last_page = min(last_page or pdf_document.page_count, pdf_document.page_count)
+            colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+
+            for page_index in range(first_page - 1, last_page):
+                page = pdf_document[page_index]
+                x_zoom, y_zoom = self._get_zoom(page.rect.width, page.rect.height, dpi, size)
+                pixmap = page.get_pixmap(matrix=fitz.Matrix(x_zoom, y_zoom), colorspace=colorspace, alpha=False)
+                images.append(Image.frombytes('L' if grayscale else 'RGB', (pixmap.width, pixmap.height),
+                                              pixmap.samples))
+        return images
+
+    @staticmethod
+    def _open(pdf_path: str):
+        """Open the PDF with PyMuPDF, raising RasterizerError if it cannot be rendered"""
+        import fitz
+
+        try:
+            pdf_document = fitz.open(pdf_path)
+        except Exception as e:  # fitz.FileDataError, RuntimeError depending on the PyMuPDF version
+            raise RasterizerError(f"cannot read {pdf_path}: {e}") from e
+
+        if pdf_document.needs_pass:
+            pdf_document.close()
+            raise RasterizerError(f"cannot read {pdf_path}: encrypted")
+        return pdf_document
+
+    @staticmethod
+    def _get_zoom(page_width: float, page_height: float, dpi: int, size: Optional[Union[tuple, int]]) -> tuple:
+        """Return the (x, y) zoom rendering a page at 'dpi' or at 'size', the way pdftoppm does"""
+        if not size:
+            return dpi / 72, dpi / 72
+
+        if isinstance(size, int):  # longest side
+            zoom = size / max(page_width, page_height)
+            return zoom, zoom
+
+        width, height = size
+        x_zoom = width / page_width if width else None
+        y_zoom = height / page_height if height else None
+        return x_zoom or y_zoom, y_zoom or x_zoom
+
+
+_RASTERIZERS = {rasterizer.name: rasterizer for rasterizer in (PopplerRasterizer, FitzRasterizer)}
+
+
+def get_rasterizer(name: str = DEFAULT_RASTERIZER) -> Rasterizer:
+    """
+    :param name: one of RASTERIZER_NAMES
+    :return: the rasterizer of that backend
+    """
+    if name not in _RASTERIZERS:
+        raise ValueError(f"unknown rasterizer '{name}', choose from {', '.join(RASTERIZER_NAMES)}")
+    return _RASTERIZERS[name]()
@@ -0,0 +1,44 @@
+from typing import Callable, Optional, Tuple
+
+
+def bisect_highest_quality(fits: Callable[[int], bool], min_quality: int = 2,
+                           max_quality: int = 98, max_iterations: int = 10) -> Tuple[Optional[int], int]:
+    """
+    Find the highest quality in [min_quality, max_quality] for which 'fits' returns True.
+
+    The output size of an encoder grows (almost) monotonically with its quality, so
+    'fits' is expected to be True for every quality below the answer and False above
+    it. Instead of walking the quality down one step at a time, the range is halved on
+    every call of 'fits', so only ~log2(max_quality - min_quality) calls are needed.
+
+    Example:
+        >>> bisect_highest_quality(lambda quality: quality <= 37)
+        (37, 6)
+
+    :param fits: callable(quality) -> bool; True if encoding at 'quality' is within target size
+    :param min_quality: lowest quality that may be chosen
+    :param max_quality: highest quality that may be chosen
+    :param max_iterations: upper bound on the number of calls of 'fits'; when it is too small to
+        bisect the range down and nothing fitted, min_quality is tried once more before giving up
+    :return: (highest fitting quality or None if nothing fits, number of calls made to 'fits')
+    """
+    low, high = min_quality, max_quality
+    best_quality = None
+    passes = 0
+
+    while low <= high and passes < max_iterations:
+        quality = (low + high + 1) // 2
+        passes += 1
+        if fits(quality):
+            best_quality = quality
+            low = quality + 1
+        else:
+            high = quality - 1
+
+    # the iterations ran out above a fitting quality: don't report "nothing fits" untested
+    if best_quality is None and low <= high:
+        passes += 1
+        if fits(min_quality):
+            best_quality = min_quality
+
+    return best_quality, passes